@@ -0,0 +1,198 @@
+"""
+Admission control for model calls.
+
+Caps the number of concurrent model requests and the estimated tokens per
+minute (token bucket). Excess requests wait in a priority queue: short calls
+(router classifier, follow-ups) go first, and within a priority sessions are
+served round-robin so one busy conversation cannot starve the others.
+Waiters are told their queue position through an optional callback.
+"""
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+
+import metrics
+from config import get_settings
+
+PRIORITY_SHORT = 0  # classifier, follow-ups
+PRIORITY_AGENT = 1  # full agent turns
+PRIORITY_BACKGROUND = 2  # cache warming; only runs when nobody is waiting
+MAX_SERVED_SESSIONS = 1000  # sessions whose last admission is remembered for round-robin
+
+
+@dataclass(eq=False)
+class _Waiter:
+    session: str
+    priority: int
+    tokens: int
+    on_queued: Callable[[int], None] | None
+    future: asyncio.Future = field(repr=False)
+    position: int = 0
+
+
+class Ticket:
+    """Handle for an admitted call; report real usage to correct the estimate."""
+
+    def __init__(self, controller: "AdmissionController", estimate: int):
+        self._controller = controller
+        self._estimate = estimate
+
+    def record_usage(self, tokens: int):
+        self._controller._charge(tokens - self._estimate)
+        self._estimate = tokens
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int, tokens_per_minute: int = 0):
+        self.max_concurrent = max_concurrent
+        self.tokens_per_minute = tokens_per_minute  # 0 disables the token bucket
+        self._active = 0
+        self._queues: dict[int, OrderedDict[str, deque[_Waiter]]] = {}
+        # session -> admission count at its last admission, most recent last
+        self._served: OrderedDict[str, int] = OrderedDict()
+        self._admissions = itertools.count(1)
+        self._tokens = float(tokens_per_minute)
+        self._refilled = time.monotonic()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for by_session in self._queues.values() for q in by_session.values())
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        session_id: str | None,
+        priority: int = PRIORITY_AGENT,
+        est_tokens: int = 0,
+        on_queued: Callable[[int], None] | None = None,
+    ):
+        """Wait for admission, then hold one concurrency slot for the block."""
+        waiter = _Waiter(
+            session=session_id or "",
+            priority=priority,
+            tokens=est_tokens,
+            on_queued=on_queued,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._queues.setdefault(priority, OrderedDict()).setdefault(waiter.session, deque()).append(waiter)
+        started = time.monotonic()
+        self._dispatch()
+        if not waiter.future.done():
+            metrics.incr("admission.queued")
+        try:
+            await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()  # admitted just as the caller was cancelled
+            else:
+                self._remove(waiter)
+                self._dispatch()
+            raise
+        metrics.observe("admission.wait_ms", (time.monotonic() - started) * 1000)
+        try:
+            yield Ticket(self, est_tokens)
+        finally:
+            self._release()
+
+    # ─── Internals (event loop thread only) ───────────────────
+
+    def _order(self) -> list[_Waiter]:
+        """Waiters in the order they would be admitted: per priority, one per
+        session per round, least recently admitted session first."""
+        out = []
+        for priority in sorted(self._queues):
+            by_session = self._queues[priority]
+            # Stable sort: sessions never admitted (or long ago) keep arrival order
+            sessions = sorted(by_session, key=lambda s: self._served.get(s, 0))
+            lanes = [list(by_session[s]) for s in sessions]
+            depth = 0
+            while True:
+                row = [lane[depth] for lane in lanes if depth < len(lane)]
+                if not row:
+                    break
+                out.extend(row)
+                depth += 1
+        return out
+
+    def _remove(self, waiter: _Waiter):
+        by_session = self._queues.get(waiter.priority)
+        lane = by_session.get(waiter.session) if by_session else None
+        if lane is None or waiter not in lane:
+            return
+        lane.remove(waiter)
+        if not lane:
+            del by_session[waiter.session]
+        if not by_session:
+            del self._queues[waiter.priority]
+
+    def _record_served(self, session: str):
+        """Every admission, queued or not, sends its session to the back of the
+        round-robin (see _order)."""
+        self._served[session] = next(self._admissions)
+        self._served.move_to_end(session)
+        if len(self._served) > MAX_SERVED_SESSIONS:
+            self._served.popitem(last=False)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.tokens_per_minute:
+            rate = self.tokens_per_minute / 60
+            self._tokens = min(self.tokens_per_minute, self._tokens + (now - self._refilled) * rate)
+        self._refilled = now
+
+    def _charge(self, tokens: float):
+        if self.tokens_per_minute:
+            self._refill()
+            self._tokens -= tokens
+            if tokens < 0:
+                self._dispatch()
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        self._refill()
+        while self._active < self.max_concurrent:
+            order = self._order()
+            if not order:
+                break
+            waiter = order[0]
+            if self.tokens_per_minute and waiter.tokens > self._tokens:
+                need = min(waiter.tokens, self.tokens_per_minute) - self._tokens
+                if need > 0:
+                    self._schedule(need * 60 / self.tokens_per_minute)
+                    break
+            self._remove(waiter)
+            self._record_served(waiter.session)
+            self._active += 1
+            if self.tokens_per_minute:
+                self._tokens -= waiter.tokens
+            waiter.future.set_result(None)
+
+        for position, waiter in enumerate(self._order(), 1):
+            if waiter.on_queued and waiter.position != position:
+                waiter.position = position
+                waiter.on_queued(position)
+
+    def _schedule(self, delay: float):
+        if self._timer is None:
+            def fire():
+                self._timer = None
+                self._dispatch()
+
+            self._timer = asyncio.get_running_loop().call_later(delay, fire)
+
+
+_settings = get_settings()
+
+# Singleton
+admission = AdmissionController(
+    max_concurrent=_settings.model_max_concurrency,
+    tokens_per_minute=_settings.model_tokens_per_minute,
+)
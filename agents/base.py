@@ -4,25 +4,151 @@ All agent classes inherit from this.
 """
 import asyncio
 import json
+import logging
+import time
 from typing import AsyncGenerator
 import anthropic
-from config import get_settings
 
-MODEL = "claude-opus-4-6"
+import metrics
+from agents.admission import PRIORITY_AGENT, admission
+from agents.client import get_client
+from agents import model_policy
+from agents.memo import is_error, make_key, tool_memo
+from tools import executor, settings_store
+from tools.executor import ToolSpec
+
+MODEL = model_policy.OPUS  # default; model_policy may pick a faster one per turn
+MAX_TOKENS = 4096
+CACHE_CONTROL = {"type": "ephemeral"}
+
+logger = logging.getLogger(__name__)
+
+
+def _cached_system(system: str | list[dict]) -> list[dict]:
+    """System blocks with a cache breakpoint on the last block (unless one exists)."""
+    if isinstance(system, str):
+        blocks = [{"type": "text", "text": system}]
+    else:
+        blocks = [dict(b) for b in system]
+    if not any("cache_control" in b for b in blocks):
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+
+def _cached_tools(tools: list[dict]) -> list[dict]:
+    """Tool list with a cache breakpoint on the last tool (caches all schemas)."""
+    if not tools:
+        return tools
+    return tools[:-1] + [{**tools[-1], "cache_control": CACHE_CONTROL}]
+
+
+def _cached_messages(messages: list[dict]) -> list[dict]:
+    """
+    Copy of messages with a cache breakpoint on the final content block, so the
+    whole conversation prefix is reused by the next tool-loop iteration or turn.
+    """
+    if not messages:
+        return messages
+    last = messages[-1]
+    content = last["content"]
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content}]
+    else:
+        blocks = list(content)
+    if not blocks or not isinstance(blocks[-1], dict):
+        return messages
+    blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+    return messages[:-1] + [{**last, "content": blocks}]
+
+
+def _last_user_text(messages: list[dict]) -> str:
+    content = messages[-1]["content"] if messages else ""
+    if isinstance(content, str):
+        return content
+    return " ".join(b.get("text", "") for b in content if isinstance(b, dict))
+
+
+def _estimate_tokens(system: list[dict], tools: list[dict], messages: list[dict]) -> int:
+    """Rough input size (chars / 4) for admission control; no tokenizer call."""
+    chars = sum(len(b.get("text", "")) for b in system)
+    chars += sum(len(json.dumps(t)) for t in tools)
+    chars += sum(len(str(m["content"])) for m in messages)
+    return chars // 4
+
+
+def _log_usage(agent: str, usage) -> None:
+    uncached = getattr(usage, "input_tokens", 0) or 0
+    read = getattr(usage, "cache_read_input_tokens", 0) or 0
+    written = getattr(usage, "cache_creation_input_tokens", 0) or 0
+    total = uncached + read + written
+    logger.info(
+        "%s usage: input=%d cache_read=%d cache_write=%d output=%d hit_rate=%.0f%%",
+        agent, uncached, read, written, getattr(usage, "output_tokens", 0) or 0,
+        100 * read / total if total else 0,
+    )
 
 
 class BaseAgent:
+    key: str = "base"  # settings_store section / routing key
     name: str = "base"
     system_prompt: str = "You are a helpful assistant."
     tools: list[dict] = []
+    # tool name -> how and where it runs (see tools/executor.py)
+    tool_specs: dict[str, ToolSpec] = {}
+    # tools whose results are never memoized across turns
+    memo_exempt: set[str] = set()
 
     def _get_client(self) -> anthropic.AsyncAnthropic:
-        return anthropic.AsyncAnthropic(api_key=get_settings().anthropic_api_key)
+        return get_client()
+
+    def get_system(self) -> str | list[dict]:
+        """System prompt for the next request. Override to add dynamic blocks."""
+        return self.system_prompt
+
+    def get_tools(self) -> list[dict]:
+        """Tool schemas for the next request. Override to vary tools per request."""
+        return self.tools
 
     async def execute_tool(self, tool_name: str, tool_input: dict) -> str:
         """Override in subclasses to handle tool execution."""
         return json.dumps({"error": f"Tool '{tool_name}' not implemented"})
 
+    def tool_version(self, tool_name: str, tool_input: dict) -> str:
+        """Version of the data a tool reads; part of its memo key. Override per agent."""
+        return ""
+
+    def data_version(self) -> str:
+        """Version of everything a stock answer depends on (agent settings and
+        tool data); keys the pre-warmed answer cache. Override per agent."""
+        cfg = json.dumps(settings_store.load().get(self.key, {}), sort_keys=True)
+        return "|".join([cfg] + [self.tool_version(t["name"], {}) for t in self.tools])
+
+    async def refresh_data_version(self):
+        """Update anything data_version() reads that is slow to compute (remote
+        data digests). Called periodically off the request path. Override per agent."""
+
+    async def _call_tool(self, tool_name: str, tool_input: dict, session_id: str | None) -> str:
+        """execute_tool with session-scoped memoization."""
+        if not session_id or tool_name in self.memo_exempt:
+            return await self.execute_tool(tool_name, tool_input)
+        key = make_key(self.name, tool_name, tool_input, self.tool_version(tool_name, tool_input))
+        cached = tool_memo.get(session_id, key)
+        if cached is not None:
+            return cached
+        result = await self.execute_tool(tool_name, tool_input)
+        tool_memo.put(session_id, key, result)
+        return result
+
+    async def run_tool(self, tool_name: str, fn, /, *args, **kwargs):
+        """Run a tool function via the executor using this agent's ToolSpec for it."""
+        spec = self.tool_specs.get(tool_name, ToolSpec())
+        try:
+            return await executor.run(tool_name, spec, fn, *args, **kwargs)
+        except asyncio.TimeoutError:
+            return json.dumps(
+                {"error": f"Tool '{tool_name}' timed out after {spec.timeout:.0f}s"}
+            )
+
     async def stream_response(
         self, messages: list[dict], context: dict | None = None
     ) -> AsyncGenerator[str, None]:
@@ -32,62 +158,119 @@ class BaseAgent:
         """
         client = self._get_client()
         context = context or {}
+        session_id = context.get("session_id")
+
+        text = _last_user_text(messages)
+        if context.get("model"):
+            model, reason = context["model"], "override"
+        else:
+            model, reason = model_policy.choose(self.key, text, "[image_id:" in text)
+        started = time.monotonic()
+        ttft_ms = None
+        output_chars = tool_calls = tool_errors = 0
 
         current_messages = list(messages)
+        system = _cached_system(self.get_system())
+        tools = _cached_tools(self.get_tools())
+        # tool_use id -> task, started as soon as the block's input JSON is complete
+        tool_tasks: dict[str, asyncio.Task] = {}
+
+        try:
+            while True:
+                tool_tasks.clear()
+
+                async with admission.slot(
+                    session_id,
+                    context.get("priority", PRIORITY_AGENT),
+                    _estimate_tokens(system, tools, current_messages) + MAX_TOKENS,
+                    context.get("on_queued"),
+                ) as ticket:
+                    async with client.messages.stream(
+                        model=model,
+                        system=system,
+                        messages=_cached_messages(current_messages),
+                        tools=tools if tools else anthropic.NOT_GIVEN,
+                        max_tokens=MAX_TOKENS,
+                    ) as stream:
+                        async for event in stream:
+                            if hasattr(event, "type"):
+                                if event.type == "content_block_delta":
+                                    if hasattr(event.delta, "text"):
+                                        if ttft_ms is None:
+                                            ttft_ms = (time.monotonic() - started) * 1000
+                                        output_chars += len(event.delta.text)
+                                        yield event.delta.text
+                                elif event.type == "content_block_stop":
+                                    block = getattr(event, "content_block", None)
+                                    if block is None:
+                                        block = stream.current_message_snapshot.content[event.index]
+                                    if block.type == "tool_use":
+                                        # Run the tool while the rest of the message streams
+                                        tool_tasks[block.id] = asyncio.create_task(
+                                            self._call_tool(block.name, block.input, session_id)
+                                        )
+
+                        final_message = await stream.get_final_message()
+
+                    usage = final_message.usage
+                    ticket.record_usage(
+                        (usage.input_tokens or 0)
+                        + (getattr(usage, "cache_creation_input_tokens", 0) or 0)
+                        + (usage.output_tokens or 0)
+                    )
+
+                _log_usage(self.name, final_message.usage)
+
+                # If no tool use, we're done
+                if final_message.stop_reason != "tool_use":
+                    break
+
+                # Collect ALL tool_use blocks (Claude may call multiple tools at once)
+                tool_use_blocks = [
+                    block for block in final_message.content if block.type == "tool_use"
+                ]
+
+                if not tool_use_blocks:
+                    break
+
+                # Await the early-started tools; start any that were missed
+                tool_results = await asyncio.gather(*[
+                    tool_tasks.get(block.id)
+                    or self._call_tool(block.name, block.input, session_id)
+                    for block in tool_use_blocks
+                ])
+                tool_calls += len(tool_results)
+                tool_errors += sum(1 for r in tool_results if is_error(r))
+
+                # Add assistant turn + all tool results and loop
+                current_messages = current_messages + [
+                    {"role": "assistant", "content": final_message.content},
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "type": "tool_result",
+                                "tool_use_id": block.id,
+                                "content": result,
+                            }
+                            for block, result in zip(tool_use_blocks, tool_results)
+                        ],
+                    },
+                ]
 
-        while True:
-            tool_use_block = None
-            text_chunks = []
-
-            async with client.messages.stream(
-                model=MODEL,
-                system=self.system_prompt,
-                messages=current_messages,
-                tools=self.tools if self.tools else anthropic.NOT_GIVEN,
-                max_tokens=4096,
-            ) as stream:
-                async for event in stream:
-                    if hasattr(event, "type"):
-                        if event.type == "content_block_delta":
-                            if hasattr(event.delta, "text"):
-                                yield event.delta.text
-                                text_chunks.append(event.delta.text)
-                        elif event.type == "content_block_start":
-                            if hasattr(event.content_block, "type") and event.content_block.type == "tool_use":
-                                tool_use_block = event.content_block
-
-                final_message = await stream.get_final_message()
-
-            # If no tool use, we're done
-            if final_message.stop_reason != "tool_use":
-                break
-
-            # Collect ALL tool_use blocks (Claude may call multiple tools at once)
-            tool_use_blocks = [
-                block for block in final_message.content if block.type == "tool_use"
-            ]
-
-            if not tool_use_blocks:
-                break
-
-            # Execute all tools in parallel
-            tool_results = await asyncio.gather(*[
-                self.execute_tool(block.name, block.input)
-                for block in tool_use_blocks
-            ])
-
-            # Add assistant turn + all tool results and loop
-            current_messages = current_messages + [
-                {"role": "assistant", "content": final_message.content},
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result,
-                        }
-                        for block, result in zip(tool_use_blocks, tool_results)
-                    ],
-                },
-            ]
+            model_policy.record(
+                self.key,
+                model,
+                reason,
+                ttft_ms=ttft_ms,
+                total_ms=(time.monotonic() - started) * 1000,
+                tool_calls=tool_calls,
+                tool_errors=tool_errors,
+                stop_reason=final_message.stop_reason,
+                output_chars=output_chars,
+            )
+        finally:
+            # cancel() is True for still-running tasks; gather may have cancelled others
+            cancelled = sum(1 for t in tool_tasks.values() if t.cancel() or t.cancelled())
+            if cancelled:
+                metrics.incr("tools.cancelled", cancelled)
@@ -2,10 +2,13 @@
 AI CFO Agent — techno-economic modeling for bacterial cellulose production.
 """
 import json
+from pathlib import Path
+
 from agents.base import BaseAgent
+from tools.executor import ToolSpec
 from tools.cfo_calculator import main as run_tem
 from tools import settings_store
-from tools.tem_parser import load_overrides
+from tools.tem_parser import KB_DIR as TEM_DIR, load_overrides
 
 
 CFO_SYSTEM_PROMPT = """You are an AI CFO for a bacterial cellulose (BC) materials company.
@@ -95,9 +98,19 @@ TEM_TOOLS = [
 
 
 class CFOAgent(BaseAgent):
+    key = "cfo"
     name = "AI CFO"
     system_prompt = CFO_SYSTEM_PROMPT
     tools = TEM_TOOLS
+    tool_specs = {"run_tem_scenario": ToolSpec(kind="cpu", max_concurrency=4, timeout=30)}
+
+    def tool_version(self, tool_name: str, tool_input: dict) -> str:
+        tem_file = settings_store.load()["cfo"].get("tem_model_file", "tem_model.md")
+        try:
+            st = (TEM_DIR / Path(tem_file).name).stat()
+        except FileNotFoundError:
+            return f"{tem_file}:missing"
+        return f"{tem_file}:{st.st_mtime_ns}:{st.st_size}"
 
     async def execute_tool(self, tool_name: str, tool_input: dict) -> str:
         if tool_name == "run_tem_scenario":
@@ -106,8 +119,8 @@ class CFOAgent(BaseAgent):
             tem_file = cfg["cfo"].get("tem_model_file", "tem_model.md")
             defaults = load_overrides(tem_file)
             merged = {**defaults, **tool_input}
-            result = run_tem(**merged)
-            return result["result"]
+            result = await self.run_tool(tool_name, run_tem, **merged)
+            return result if isinstance(result, str) else result["result"]
         return json.dumps({"error": f"Unknown tool: {tool_name}"})
 
 
@@ -0,0 +1,53 @@
+"""
+Process-wide Anthropic client shared by agents, the router and follow-up generation.
+Created once at app startup (FastAPI lifespan) on a pooled keep-alive HTTP client,
+closed on shutdown. Tests can swap in a stand-in with set_client().
+"""
+import anthropic
+import httpx
+
+from config import get_settings
+
+_client: anthropic.AsyncAnthropic | None = None
+
+
+def create_client() -> anthropic.AsyncAnthropic:
+    s = get_settings()
+    http_client = anthropic.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=s.anthropic_max_connections,
+            max_keepalive_connections=s.anthropic_max_keepalive,
+            keepalive_expiry=s.anthropic_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(s.anthropic_timeout, connect=s.anthropic_connect_timeout),
+    )
+    return anthropic.AsyncAnthropic(
+        api_key=s.anthropic_api_key,
+        http_client=http_client,
+        max_retries=s.anthropic_max_retries,
+    )
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+    """Return the shared client, creating it lazily outside the app lifespan."""
+    global _client
+    if _client is None:
+        _client = create_client()
+    return _client
+
+
+def set_client(client: anthropic.AsyncAnthropic | None):
+    """Replace the shared client (e.g. with a local stand-in in tests)."""
+    global _client
+    _client = client
+
+
+async def startup():
+    get_client()
+
+
+async def shutdown():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -5,9 +5,10 @@ import json
 from pathlib import Path
 
 from agents.base import BaseAgent
+from tools.executor import ToolSpec
 from config import get_settings
 from tools import settings_store
-from tools.kb_loader import search as kb_search
+from tools.kb_loader import kb_index, search as kb_search
 from tools.replicate_client import run_prediction
 
 # Default Replicate model version (from AI Designer.yml env vars)
@@ -16,6 +17,7 @@ DEFAULT_REPLICATE_VERSION = (
 )
 
 UPLOAD_DIR = Path(__file__).parent.parent / "data" / "uploads"
+KB_EXCLUDE = {"tem_model.md"}
 
 DESIGNER_SYSTEM_PROMPT = """\
 You are AI Designer, a design advisor for bacterial cellulose (BC) pellicle materials.
@@ -84,10 +86,71 @@ DESIGNER_TOOLS = [
 ]
 
 
+INLINE_KB_NOTE = """\
+The complete design knowledge base is included below. Answer design questions \
+from it directly — there is no need to call search_knowledge_base.
+"""
+
+
 class DesignerAgent(BaseAgent):
+    key = "designer"
     name = "AI Designer"
     system_prompt = DESIGNER_SYSTEM_PROMPT
     tools = DESIGNER_TOOLS
+    tool_specs = {
+        "analyze_bc_image": ToolSpec(kind="async", max_concurrency=4, timeout=180),
+        "search_knowledge_base": ToolSpec(kind="io", max_concurrency=8, timeout=15),
+    }
+
+    def __init__(self):
+        self._inline_key: tuple | None = None
+        self._inline_block: dict | None = None
+
+    def _inline_kb(self) -> dict | None:
+        """
+        Return a prompt-cache-marked system block holding the whole KB when it is
+        below designer.kb_inline_max_chars, else None. Rebuilt only when the KB
+        index version or the threshold changes. The index is kept in sync with
+        disk by its background task (KBIndex.run), not here on the request path.
+        """
+        limit = int(settings_store.load()["designer"]["kb_inline_max_chars"])
+        key = (kb_index.version, limit)
+        if key != self._inline_key:
+            chunks = kb_index.chunks(exclude=KB_EXCLUDE)
+            size = sum(len(text) for _, text in chunks)
+            block = None
+            if chunks and size <= limit:
+                docs: dict[str, list[str]] = {}
+                for src, text in chunks:
+                    docs.setdefault(src, []).append(text)
+                body = "\n\n".join(
+                    f'<document source="{src}">\n' + "\n\n".join(parts) + "\n</document>"
+                    for src, parts in docs.items()
+                )
+                block = {
+                    "type": "text",
+                    "text": f"{INLINE_KB_NOTE}\n<knowledge_base>\n{body}\n</knowledge_base>",
+                    "cache_control": {"type": "ephemeral"},
+                }
+            self._inline_key, self._inline_block = key, block
+        return self._inline_block
+
+    def get_system(self) -> str | list[dict]:
+        block = self._inline_kb()
+        if block is None:
+            return self.system_prompt
+        return [{"type": "text", "text": self.system_prompt}, block]
+
+    def get_tools(self) -> list[dict]:
+        if self._inline_kb() is None:
+            return self.tools
+        return [t for t in self.tools if t["name"] != "search_knowledge_base"]
+
+    def tool_version(self, tool_name: str, tool_input: dict) -> str:
+        cfg = settings_store.load()["designer"]
+        if tool_name == "analyze_bc_image":
+            return cfg.get("replicate_version") or DEFAULT_REPLICATE_VERSION
+        return f"kb{kb_index.content_version()}:{cfg['kb_token_budget']}"
 
     async def execute_tool(self, tool_name: str, tool_input: dict) -> str:
         if tool_name == "analyze_bc_image":
@@ -100,14 +163,24 @@ class DesignerAgent(BaseAgent):
             )
             rep_token = get_settings().replicate_api_token
             if not rep_token:
-                return "REPLICATE_API_TOKEN is not configured. Add it to your .env file."
+                return "ERROR: REPLICATE_API_TOKEN is not configured. Add it to your .env file."
 
-            return await run_prediction(image_path, rep_token, rep_version)
+            return await self.run_tool(
+                tool_name, run_prediction, image_path, rep_token, rep_version
+            )
 
         if tool_name == "search_knowledge_base":
             query = tool_input.get("query", "")
             top_k = int(tool_input.get("top_k", 4))
-            return kb_search(query, top_k=top_k, exclude={"tem_model.md"})
+            budget = int(settings_store.load()["designer"]["kb_token_budget"])
+            return await self.run_tool(
+                tool_name,
+                kb_search,
+                query,
+                top_k=top_k,
+                exclude=KB_EXCLUDE,
+                token_budget=budget,
+            )
 
         return json.dumps({"error": f"Unknown tool: {tool_name}"})
 
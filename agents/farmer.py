@@ -1,13 +1,41 @@
 """
 AI Farmer Agent — BC production data analysis.
 """
+import asyncio
+import hashlib
 import json
+import logging
+import ssl
+import time
+import urllib.request
 from agents.base import BaseAgent
+from tools.executor import ToolSpec
 from tools.farmer_analytics import main as run_analytics
 from tools.farmer_schema import main as run_schema
 from tools.google_sheets import sheets_url_to_csv
 from tools import settings_store
 
+# Sheets can change at any time; memoized results are trusted for this long
+FARMER_DATA_TTL = 300  # seconds
+# Pre-warmed answers are keyed on a digest of the sheets, re-fetched this often;
+# while no digest could be fetched they fall back to hourly buckets (and are
+# rebuilt in the background as each bucket expires)
+FARMER_DIGEST_TTL = 300  # seconds
+FARMER_ANSWER_TTL = 3600  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+def _fetch_digest(urls: tuple[str, ...]) -> str:
+    """sha256 over the raw CSV exports of the data sources."""
+    ctx = ssl._create_unverified_context()
+    h = hashlib.sha256()
+    for url in urls:
+        with urllib.request.urlopen(url, context=ctx, timeout=15) as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
 FARMER_SYSTEM_PROMPT = """You are AI Farmer, a data analyst for bacterial cellulose (BC) \
 static tray production.
 
@@ -86,9 +114,18 @@ FARMER_TOOLS = [
 
 
 class FarmerAgent(BaseAgent):
+    key = "farmer"
     name = "AI Farmer"
     system_prompt = FARMER_SYSTEM_PROMPT
     tools = FARMER_TOOLS
+    tool_specs = {
+        "query_production_data": ToolSpec(kind="cpu", max_concurrency=4, timeout=60),
+        "query_schema": ToolSpec(kind="io", max_concurrency=4, timeout=60),
+    }
+
+    def __init__(self):
+        self._data_digest: tuple[tuple[str, str], str] | None = None  # (urls, digest)
+        self._digest_checked = 0.0
 
     def _get_urls(self):
         cfg = settings_store.load()["farmer"]
@@ -101,27 +138,74 @@ class FarmerAgent(BaseAgent):
             )
         return runs_url, treatments_url
 
+    def tool_version(self, tool_name: str, tool_input: dict) -> str:
+        try:
+            runs_url, treatments_url = self._get_urls()
+        except ValueError:
+            return ""
+        return f"{runs_url}|{treatments_url}|{int(time.time() // FARMER_DATA_TTL)}"
+
+    def data_version(self) -> str:
+        cfg = json.dumps(settings_store.load()["farmer"], sort_keys=True)
+        if self._urls_or_none() is None:
+            return f"{cfg}|unconfigured"  # nothing to fetch; only settings can change it
+        digest = None
+        if self._data_digest is not None:
+            urls, digest = self._data_digest
+            if urls != self._urls_or_none():
+                digest = None  # data sources changed since the last fetch
+        return f"{cfg}|{digest or int(time.time() // FARMER_ANSWER_TTL)}"
+
+    async def refresh_data_version(self):
+        urls = self._urls_or_none()
+        if urls is None:
+            self._data_digest = None
+            return
+        if (
+            self._data_digest is not None
+            and self._data_digest[0] == urls
+            and time.monotonic() - self._digest_checked < FARMER_DIGEST_TTL
+        ):
+            return
+        try:
+            digest = await asyncio.to_thread(_fetch_digest, urls)
+        except Exception as e:
+            logger.warning("Could not fetch Farmer data digest: %s", e)
+            return
+        self._data_digest = (urls, digest)
+        self._digest_checked = time.monotonic()
+
+    def _urls_or_none(self) -> tuple[str, str] | None:
+        try:
+            return self._get_urls()
+        except ValueError:
+            return None
+
     async def execute_tool(self, tool_name: str, tool_input: dict) -> str:
         try:
             runs_url, treatments_url = self._get_urls()
         except ValueError as e:
-            return json.dumps({"result": str(e)})
+            return json.dumps({"error": str(e)})
 
         if tool_name == "query_production_data":
-            result = run_analytics(
+            result = await self.run_tool(
+                tool_name,
+                run_analytics,
                 runs_csv_url=runs_url,
                 treatments_csv_url=treatments_url,
                 **tool_input,
             )
-            return result["result"]
+            return result if isinstance(result, str) else result["result"]
 
         if tool_name == "query_schema":
-            result = run_schema(
+            result = await self.run_tool(
+                tool_name,
+                run_schema,
                 runs_csv_url=runs_url,
                 treatments_csv_url=treatments_url,
                 **tool_input,
             )
-            return result["result"]
+            return result if isinstance(result, str) else result["result"]
 
         return json.dumps({"error": f"Unknown tool: {tool_name}"})
 
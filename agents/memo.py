@@ -0,0 +1,69 @@
+"""
+Session-scoped memoization of tool results.
+Keyed on (agent, tool name, canonical input, data version) so a repeated call
+within a conversation returns instantly, and any change to the underlying
+data (TEM file, KB, data sources) naturally misses.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+import metrics
+
+MAX_SESSIONS = 1000
+MAX_ENTRIES_PER_SESSION = 64
+
+
+def make_key(agent: str, tool_name: str, tool_input: dict, version: str) -> tuple:
+    canonical = json.dumps(tool_input, sort_keys=True, separators=(",", ":"), default=str)
+    return (agent, tool_name, canonical, version)
+
+
+def is_error(result: str) -> bool:
+    """True for a tool failure. Tools report failures instead of raising, as
+    text starting with "ERROR" or as a JSON object with an "error" key."""
+    head = result.lstrip()[:40]
+    return head.startswith("ERROR") or head.startswith('{"error"')
+
+
+class ToolMemo:
+    def __init__(self, max_sessions: int = MAX_SESSIONS, max_entries: int = MAX_ENTRIES_PER_SESSION):
+        self.max_sessions = max_sessions
+        self.max_entries = max_entries
+        self._sessions: OrderedDict[str, OrderedDict[tuple, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, key: tuple) -> str | None:
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            result = entries.get(key) if entries is not None else None
+            if result is not None:
+                self._sessions.move_to_end(session_id)
+                entries.move_to_end(key)
+        metrics.incr("tool_memo.hits" if result is not None else "tool_memo.misses")
+        return result
+
+    def put(self, session_id: str, key: tuple, result: str):
+        if is_error(result):
+            return  # never memoize errors — the next call should get a chance to succeed
+        with self._lock:
+            entries = self._sessions.get(session_id)
+            if entries is None:
+                entries = self._sessions[session_id] = OrderedDict()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            entries[key] = result
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def hit_rate(self) -> float | None:
+        return metrics.ratio("tool_memo.hits", "tool_memo.misses")
+
+
+# Singleton
+tool_memo = ToolMemo()
@@ -0,0 +1,124 @@
+"""
+Per-request model selection for agent turns.
+
+Simple, tool-dominated or help requests ("show the 2024 dataset", "list the
+fields") go to a faster model; open-ended reasoning keeps the default (Opus).
+The policy is configured per agent under "<agent>.model_policy" in
+data/settings.json. Every turn's choice is recorded with latency and quality
+signals in /metrics and in data/model_decisions.jsonl (size-capped, written
+in the background) so the patterns can be tuned.
+"""
+import re
+import time
+from pathlib import Path
+
+import metrics
+from tools import settings_store
+from tools.jsonl_log import JsonlLog
+
+OPUS = "claude-opus-4-6"
+SONNET = "claude-sonnet-4-5"
+
+DECISION_LOG = Path(__file__).parent.parent / "data" / "model_decisions.jsonl"
+DECISION_LOG_MAX_BYTES = 5 * 1024 * 1024
+_decision_log = JsonlLog(DECISION_LOG, DECISION_LOG_MAX_BYTES)
+
+DEFAULT_POLICY = {
+    "mode": "auto",  # "auto" | "fixed" (always default_model)
+    "default_model": OPUS,
+    "fast_model": SONNET,
+    "fast_max_chars": 160,  # longer messages are treated as open-ended
+    "fast_patterns": [],  # extra regexes (case-insensitive) that allow the fast model
+}
+
+# Requests whose answer is essentially the tool output, or a canned help reply
+_FAST_PATTERNS = {
+    "farmer": [
+        r"^(show|list|display|give me)\b",
+        r"\bas a table\b",
+        r"\b(dataset|fields?|columns?|schema|coverage)\b",
+        r"\btop \d+\b",
+    ],
+    "cfo": [
+        r"\b(using|with) (all )?defaults?\b",
+        r"^run (a |the )?scenario\b",
+    ],
+    "designer": [],
+}
+# A bare greeting/"help", or a question about the assistant itself
+_HELP = re.compile(
+    r"^(help|hi|hello|hey)[\s!.?]*$|\bwhat can you do\b|\bexample questions?\b|\bhow do i use\b",
+    re.IGNORECASE,
+)
+# Open-ended reasoning always keeps the default model
+_REASONING = re.compile(
+    r"\b(why|explain|improve|recommend|should|suggest|design|interpret|"
+    r"what if|trade-?offs?|sensitiv\w*|driv\w*|compare)\b",
+    re.IGNORECASE,
+)
+
+
+def get_policy(agent_key: str) -> dict:
+    cfg = settings_store.load().get(agent_key, {}).get("model_policy") or {}
+    return {**DEFAULT_POLICY, **cfg}
+
+
+def choose(agent_key: str, text: str, has_image: bool = False) -> tuple[str, str]:
+    """Return (model, reason) for one agent turn."""
+    policy = get_policy(agent_key)
+    default, fast = policy["default_model"], policy["fast_model"]
+    text = text.strip()
+    if policy["mode"] != "auto" or not fast:
+        return default, "fixed"
+    if has_image:
+        return default, "image"
+    if _REASONING.search(text):
+        return default, "reasoning"
+    if _HELP.search(text) and len(text) <= policy["fast_max_chars"]:
+        return fast, "help"
+    if len(text) > policy["fast_max_chars"]:
+        return default, "long"
+    patterns = _FAST_PATTERNS.get(agent_key, []) + list(policy["fast_patterns"])
+    if any(re.search(p, text, re.IGNORECASE) for p in patterns):
+        return fast, "tool_dominated"
+    return default, "default"
+
+
+def record(
+    agent_key: str,
+    model: str,
+    reason: str,
+    *,
+    ttft_ms: float | None,
+    total_ms: float,
+    tool_calls: int,
+    tool_errors: int,
+    stop_reason: str | None,
+    output_chars: int,
+):
+    """Record latency and quality signals for one completed turn."""
+    prefix = f"model.{agent_key}.{model}"
+    metrics.incr(f"{prefix}.turns")
+    if ttft_ms is not None:
+        metrics.observe(f"{prefix}.ttft_ms", ttft_ms)
+    metrics.observe(f"{prefix}.total_ms", total_ms)
+    if tool_errors:
+        metrics.incr(f"{prefix}.tool_errors", tool_errors)
+    if stop_reason == "max_tokens":
+        metrics.incr(f"{prefix}.truncated")
+    if not output_chars:
+        metrics.incr(f"{prefix}.empty")
+
+    _decision_log.append({
+        "ts": time.time(),
+        "agent": agent_key,
+        "model": model,
+        "reason": reason,
+        "ttft_ms": ttft_ms,
+        "total_ms": total_ms,
+        "tool_calls": tool_calls,
+        "tool_errors": tool_errors,
+        "stop_reason": stop_reason,
+        "output_chars": output_chars,
+    })
+
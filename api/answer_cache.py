@@ -0,0 +1,265 @@
+"""
+Pre-warmed answers to the suggested questions.
+
+Users click SUGGESTED_QUESTIONS far more often than they type, and with the
+same TEM file, KB and datasets the answer is the same every time. When a
+suggested question misses (no answer yet, or the agent's data version
+changed), the live request that missed answers it anyway, and its finished
+text is recorded against the version (BaseAgent.data_version) seen when it
+started. Only if that request produces no answer does a background task
+build one at background admission priority. Later clicks in a fresh session
+are replayed from here as a normal SSE stream instead of a classifier +
+model + tool run. Recorded answers whose version has since moved on are
+rebuilt in the background; questions never asked are never built, so idle
+periods and restarts cost nothing.
+"""
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: single worker assumed
+    fcntl = None
+
+import metrics
+from agents.admission import PRIORITY_BACKGROUND
+
+CACHE_PATH = Path(__file__).parent.parent / "data" / "answer_cache.json"
+LOCK_PATH = CACHE_PATH.with_suffix(".lock")
+DEMAND_PATH = CACHE_PATH.with_suffix(".demand")  # misses and answers from other workers
+REPLAY_CHUNK_CHARS = 80  # recorded text is re-chunked to this size
+REPLAY_DELAY = 0.01  # seconds between replayed chunks
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+def _chunk(text: str) -> list[str]:
+    return [text[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(text), REPLAY_CHUNK_CHARS)]
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        lock_path: Path = LOCK_PATH,
+        demand_path: Path = DEMAND_PATH,
+    ):
+        self.path = path
+        self.lock_path = lock_path
+        self.demand_path = demand_path
+        self._lock_file = None
+        self._agents: dict = {}
+        # (agent_key, normalized question) -> question as asked to the agent
+        self._known: dict[tuple[str, str], str] = {}
+        self._demand: set[tuple[str, str]] = set()  # missed keys to (re)build
+        # (agent_key, normalized question) -> {"version": str, "chunks": list[str]}
+        self._entries: dict[tuple[str, str], dict] = {}
+        self._recorded: dict[tuple[str, str], dict] = {}  # live answers not yet on disk
+        self._live: dict[tuple[str, str], str] = {}  # missed key -> version being answered
+        self._wake = asyncio.Event()
+
+    def configure(self, agents: dict, questions: dict[str, list[str]]):
+        """Register the agents and the questions to keep warm."""
+        self._agents = agents
+        self._known = {(k, _normalize(q)): q for k, qs in questions.items() for q in qs}
+
+    def get(self, agent_key: str, question: str) -> list[str] | None:
+        """Recorded chunks for a suggested question, if current for the agent's data."""
+        key = (agent_key, _normalize(question))
+        if key not in self._known:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None and entry["version"] == self._agents[agent_key].data_version():
+            metrics.incr("answer_cache.hits")
+            return entry["chunks"]
+        metrics.incr("answer_cache.misses")
+        self._live[key] = self._agents[agent_key].data_version()
+        return None
+
+    def record(self, agent_key: str, question: str, text: str | None):
+        """Outcome of the live request for a question get() missed: a finished
+        answer is stored for the version seen at the miss; no answer (error,
+        cancelled stream) queues a background build instead."""
+        key = (agent_key, _normalize(question))
+        version = self._live.pop(key, None)
+        if version is None:
+            return
+        if text:
+            entry = {"version": version, "chunks": _chunk(text)}
+            self._entries[key] = self._recorded[key] = entry
+            metrics.incr("answer_cache.recorded")
+        else:
+            self._demand.add(key)
+        self.refresh()
+
+    def refresh(self):
+        """Wake the background task to rebuild missed answers and re-check versions."""
+        self._wake.set()
+
+    def hit_rate(self) -> float | None:
+        return metrics.ratio("answer_cache.hits", "answer_cache.misses")
+
+    @staticmethod
+    async def replay(chunks: list[str]):
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep(REPLAY_DELAY)
+
+    async def run(self, interval: float):
+        """Background task: persist recorded answers and rebuild stale or
+        unanswered ones. With several workers only the one holding the lock
+        file writes the cache and builds; the others hand their misses and
+        recorded answers over through the demand file and pick the result up
+        from disk."""
+        while True:
+            self._wake.clear()
+            self._load()
+            self._entries.update(self._recorded)  # not on disk yet
+            try:
+                # Only agents with answers to check or build need fresh versions
+                for agent_key in {k for k, _ in self._entries} | {k for k, _ in self._demand}:
+                    await self._agents[agent_key].refresh_data_version()
+                if self._is_builder():
+                    self._take_demand()
+                    if self._recorded:
+                        self._save()
+                        self._recorded.clear()
+                    # Data or settings changed since these were recorded
+                    self._demand |= {
+                        key for key, entry in self._entries.items()
+                        if entry["version"] != self._agents[key[0]].data_version()
+                    }
+                    await self._warm()
+                else:
+                    self._give_demand()
+            except Exception:
+                logger.exception("Answer cache warm-up failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    # ─── Internals ─────────────────────────────────────────────
+
+    def _is_builder(self) -> bool:
+        if fcntl is None or self._lock_file is not None:
+            return True
+        try:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            f = open(self.lock_path, "w")
+        except OSError:
+            return True
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f  # held for the life of the process
+        return True
+
+    async def _warm(self):
+        for key in sorted(self._demand):
+            if key in self._live:  # being answered by a request right now
+                continue
+            agent_key, _ = key
+            agent = self._agents[agent_key]
+            version = agent.data_version()
+            entry = self._entries.get(key)
+            if entry is None or entry["version"] != version:
+                try:
+                    text = "".join([
+                        chunk async for chunk in agent.stream_response(
+                            [{"role": "user", "content": self._known[key]}],
+                            {"priority": PRIORITY_BACKGROUND},
+                        )
+                    ])
+                except Exception as e:
+                    # Likely systemic (no API key, outage); retry next round
+                    metrics.incr("answer_cache.build_errors")
+                    logger.warning("Could not pre-warm %s answer: %s", agent_key, e)
+                    return
+                if text:
+                    self._entries[key] = {"version": version, "chunks": _chunk(text)}
+                    metrics.incr("answer_cache.builds")
+                    self._save()
+            self._demand.discard(key)
+
+    def _give_demand(self):
+        """Append this worker's misses ([agent, question]) and recorded
+        answers (entry objects) to the demand file for the builder."""
+        if not self._demand and not self._recorded:
+            return
+        lines = "".join(json.dumps(list(key)) + "\n" for key in sorted(self._demand))
+        lines += "".join(
+            json.dumps({"agent": agent, "question": question, **entry}) + "\n"
+            for (agent, question), entry in self._recorded.items()
+        )
+        try:
+            with open(self.demand_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        except OSError as e:
+            logger.warning("Could not hand over answer cache misses: %s", e)
+            return
+        self._demand.clear()
+        self._recorded.clear()
+
+    def _take_demand(self):
+        """Merge what other workers handed over (the file is consumed)."""
+        taken = self.demand_path.with_suffix(f".demand.{os.getpid()}")
+        try:
+            os.replace(self.demand_path, taken)
+            lines = taken.read_text(encoding="utf-8").splitlines()
+            taken.unlink()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, dict):
+                key = (item["agent"], item["question"])
+                current = self._entries.get(key)
+                if key in self._known and (
+                    current is None
+                    or current["version"] != self._agents[key[0]].data_version()
+                ):
+                    self._entries[key] = self._recorded[key] = {
+                        "version": item["version"], "chunks": item["chunks"],
+                    }
+            elif tuple(item) in self._known:
+                self._demand.add(tuple(item))
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for e in data.get("entries", []):
+            key = (e["agent"], e["question"])
+            if key in self._known:
+                self._entries[key] = {"version": e["version"], "chunks": e["chunks"]}
+
+    def _save(self):
+        entries = [
+            {"agent": agent, "question": question, **entry}
+            for (agent, question), entry in self._entries.items()
+        ]
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps({"entries": entries}), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Could not persist answer cache: %s", e)
+
+
+# Singleton; api.chat registers the agents and SUGGESTED_QUESTIONS at import
+answer_cache = AnswerCache()
@@ -1,18 +1,41 @@
+import asyncio
 import json
+import logging
 import random
 import uuid
-import anthropic
-from fastapi import APIRouter, Cookie
+from collections import OrderedDict
+from contextlib import aclosing
+from fastapi import APIRouter, Cookie, Header, Request
 from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 
+from agents.admission import PRIORITY_SHORT, admission
 from agents.cfo import cfo_agent
+from agents.client import get_client
 from agents.designer import designer_agent
+from agents.memo import tool_memo
 from agents.farmer import farmer_agent
+from api import sse
+from api.answer_cache import answer_cache
+from api.streams import Listener, ResponseStream, response_streams
+from config import get_settings
 from router.mention_router import parse_message
-from router.orchestrator import classify_agent
+from router.local_classifier import local_classifier, log_decision
+from router.orchestrator import classify_local, classify_remote
+from session.compaction import history_budget
 from session.context_store import context_store
-from config import get_settings
+import metrics
+
+logger = logging.getLogger(__name__)
+_settings = get_settings()
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+# Follow-ups only see the start of the answer, so they can start once this much
+# has streamed; the stream stays open up to FOLLOW_UP_TIMEOUT after `done`.
+FOLLOW_UP_CONTEXT_CHARS = 600
+FOLLOW_UP_TIMEOUT = 15.0
+FOLLOW_UP_CACHE_SIZE = 256
 
 _AGENT_DOMAIN = {
     "designer": "material design and bacterial cellulose properties",
@@ -21,26 +44,110 @@ _AGENT_DOMAIN = {
 }
 
 
+_follow_up_cache: OrderedDict[tuple, list[str]] = OrderedDict()
+
+
 async def generate_follow_ups(agent_key: str, question: str, answer: str) -> list[str]:
+    answer = answer[:FOLLOW_UP_CONTEXT_CHARS]
+    key = (agent_key, " ".join(question.lower().split()), answer)
+    cached = _follow_up_cache.get(key)
+    metrics.incr("follow_ups.cache_hits" if cached else "follow_ups.cache_misses")
+    if cached:
+        _follow_up_cache.move_to_end(key)
+        return cached
     try:
-        client = anthropic.AsyncAnthropic(api_key=get_settings().anthropic_api_key)
+        client = get_client()
         domain = _AGENT_DOMAIN.get(agent_key, agent_key)
-        msg = await client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=120,
-            messages=[{
-                "role": "user",
-                "content": (
-                    f"Given this Q&A about {domain}, suggest 2 short follow-up questions "
-                    f"the user might want to ask next.\n\n"
-                    f"Q: {question}\nA: {answer[:600]}\n\n"
-                    f'Return only a JSON array of 2 strings. Example: ["Question 1?", "Question 2?"]'
-                ),
-            }],
-        )
-        return json.loads(msg.content[0].text.strip())[:2]
+        async with admission.slot(None, PRIORITY_SHORT, 400):
+            msg = await client.messages.create(
+                model="claude-haiku-4-5-20251001",
+                max_tokens=120,
+                messages=[{
+                    "role": "user",
+                    "content": (
+                        f"Given this Q&A about {domain}, suggest 2 short follow-up questions "
+                        f"the user might want to ask next.\n\n"
+                        f"Q: {question}\nA: {answer}\n\n"
+                        f'Return only a JSON array of 2 strings. Example: ["Question 1?", "Question 2?"]'
+                    ),
+                }],
+            )
+        follow_ups = json.loads(msg.content[0].text.strip())[:2]
     except Exception:
         return []
+    if follow_ups:
+        _follow_up_cache[key] = follow_ups
+        while len(_follow_up_cache) > FOLLOW_UP_CACHE_SIZE:
+            _follow_up_cache.popitem(last=False)
+    return follow_ups
+
+
+async def _detach_on_disconnect(http_request: Request, listener: Listener):
+    """Close listener once the client has gone away (checked every DISCONNECT_POLL_SECONDS)."""
+    while not listener.gone:
+        if await http_request.is_disconnected():
+            listener.close()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+async def _follow(http_request: Request, stream: ResponseStream, after: int = 0):
+    """Send a response stream's frames to one connection. Disconnecting only
+    detaches; the generation keeps running for a reconnect (see api.streams)."""
+    listener = stream.attach()
+    watcher = asyncio.create_task(_detach_on_disconnect(http_request, listener))
+    try:
+        async for frame in stream.follow(after, listener):
+            yield frame
+    finally:
+        watcher.cancel()
+        stream.detach(listener)
+
+
+async def _speculate(agent, messages: list[dict], context: dict, classify_task: asyncio.Task):
+    """
+    Start `agent` (the session's sticky agent) while the classifier decides.
+    Returns (target, chunks): if the classifier agrees, chunks iterates the
+    buffered and then live speculative stream; otherwise the speculative
+    stream is cancelled and chunks is None.
+    """
+    buffer: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for chunk in agent.stream_response(messages, context):
+                buffer.put_nowait(chunk)
+        except Exception as e:
+            buffer.put_nowait(e)
+        finally:
+            buffer.put_nowait(None)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        target = await classify_task
+    except BaseException:
+        classify_task.cancel()
+        pump_task.cancel()
+        raise
+
+    if target != agent.key:
+        pump_task.cancel()
+        metrics.incr("router.speculation.miss")
+        return target, None
+
+    metrics.incr("router.speculation.hit")
+
+    async def drain():
+        try:
+            while (item := await buffer.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            pump_task.cancel()
+
+    return target, drain()
+
 
 router = APIRouter()
 
@@ -90,6 +197,14 @@ SUGGESTED_QUESTIONS = {
 }
 
 
+# The suggested questions double as labelled routing examples
+local_classifier.add_examples(SUGGESTED_QUESTIONS)
+# ...and are answered ahead of time for fresh sessions
+answer_cache.configure(AGENT_REGISTRY, SUGGESTED_QUESTIONS)
+
+_AGENT_KEYS = {agent.name: key for key, agent in AGENT_REGISTRY.items()}
+
+
 class ChatRequest(BaseModel):
     message: str
     session_id: str | None = None
@@ -97,7 +212,7 @@ class ChatRequest(BaseModel):
 
 
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     # Resolve or create session ID
     session_id = request.session_id or str(uuid.uuid4())
     parsed = parse_message(request.message, request.image_id)
@@ -107,44 +222,173 @@ async def chat(request: ChatRequest):
     if request.image_id:
         user_content = f"[image_id: {request.image_id}]\n{user_content}"
 
-    history = context_store.get_claude_messages(session_id)
+    history = await context_store.get_claude_messages(session_id)
 
-    # Determine target agent — use orchestrator if no @mention
-    if parsed.target_agent and parsed.target_agent in AGENT_REGISTRY:
-        target = parsed.target_agent
+    # Determine target agent — use orchestrator if no @mention. When the local
+    # classifier is unsure (or, mid-conversation, names a different agent than
+    # the session's current one) and the session has a previous agent, that agent
+    # starts speculatively while Haiku classifies (resolved in produce()).
+    # Several @mentions fan out to every mentioned agent concurrently.
+    classify_task = None
+    targets = [t for t in parsed.target_agents if t in AGENT_REGISTRY]
+    if targets:
+        target = targets[0]
+        if len(targets) == 1 and parsed.clean_text and not request.image_id:
+            log_decision(parsed.clean_text, target, "mention", bool(history))
     else:
-        target = await classify_agent(history, user_content)
+        sticky = _AGENT_KEYS.get(await context_store.last_agent(session_id)) if history else None
+        target = classify_local(user_content, history, sticky)
+        if target is None:
+            classify_task = asyncio.create_task(classify_remote(history, user_content))
+            if sticky:
+                target = sticky
+            else:
+                target = await classify_task
+                classify_task = None
         if target not in AGENT_REGISTRY:
             target = "cfo"
+        targets = [target]
 
-    agent = AGENT_REGISTRY[target]
-    context_store.add_message(session_id, "user", "user", user_content)
+    # A suggested question clicked in a fresh session replays its pre-warmed answer;
+    # on a miss this request's own answer is recorded for the next click
+    cacheable = len(targets) == 1 and classify_task is None and not history and not request.image_id
+    cached_answer = answer_cache.get(target, user_content) if cacheable else None
 
-    async def event_stream():
-        full_response = []
+    # Each agent gets the history compacted to its own token budget
+    histories = {
+        key: await context_store.get_claude_messages(session_id, history_budget(key))
+        for key in (AGENT_REGISTRY if classify_task is not None else targets)
+    }
 
-        yield f"data: {json.dumps({'type': 'session_id', 'session_id': session_id})}\n\n"
-        yield f"data: {json.dumps({'type': 'agent', 'agent': agent.name, 'agent_key': target})}\n\n"
+    await context_store.add_message(session_id, "user", "user", user_content)
 
-        messages = history + [{"role": "user", "content": user_content}]
+    # Work runs in its own task so a client disconnect can cancel the model
+    # stream, in-flight tools and the follow-up call, not just stop writing.
+    progress = {"chars": 0, "stage": "agent"}
 
+    async def produce(queue: asyncio.Queue):
+        follow_up_tasks: list[asyncio.Task] = []
         try:
-            async for chunk in agent.stream_response(messages):
-                full_response.append(chunk)
-                yield f"data: {json.dumps({'type': 'text', 'content': chunk})}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+            queue.put_nowait({"type": "session_id", "session_id": session_id, "stream_id": stream.id})
+
+            def messages_for(agent_key: str) -> list[dict]:
+                return histories[agent_key] + [{"role": "user", "content": user_content}]
+
+            # With several agents every frame carries its agent_key for the UI to demux
+            tagged = len(targets) > 1
+
+            def context_for(agent_key: str) -> dict:
+                tag = {"agent_key": agent_key} if tagged else {}
+
+                def on_queued(position: int):
+                    queue.put_nowait({"type": "queued", "position": position, **tag})
 
-        complete_response = "".join(full_response)
-        if complete_response:
-            context_store.add_message(session_id, "assistant", agent.name, complete_response)
-            follow_ups = await generate_follow_ups(target, user_content, complete_response)
-            if follow_ups:
-                yield f"data: {json.dumps({'type': 'follow_up', 'agent_key': target, 'questions': follow_ups})}\n\n"
+                return {"session_id": session_id, "on_queued": on_queued}
 
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+            if classify_task is not None:
+                agent_key, chunks = await _speculate(
+                    AGENT_REGISTRY[target], messages_for(target), context_for(target), classify_task
+                )
+                if agent_key not in AGENT_REGISTRY:
+                    agent_key = "cfo"
+                runs = [(agent_key, chunks)]
+            elif cached_answer is not None:
+                runs = [(target, answer_cache.replay(cached_answer))]
+            else:
+                runs = [(agent_key, None) for agent_key in targets]
 
-    response = StreamingResponse(event_stream(), media_type="text/event-stream")
+            def start_follow_ups(agent_key: str, answer: str) -> asyncio.Task:
+                task = asyncio.create_task(generate_follow_ups(agent_key, user_content, answer))
+                follow_up_tasks.append(task)
+                return task
+
+            async def relay(agent_key: str, chunks) -> tuple[str, asyncio.Task | None]:
+                agent = AGENT_REGISTRY[agent_key]
+                if chunks is None:
+                    chunks = agent.stream_response(messages_for(agent_key), context_for(agent_key))
+                tag = {"agent_key": agent_key} if tagged else {}
+                queue.put_nowait({"type": "agent", "agent": agent.name, "agent_key": agent_key})
+                full_response = []
+                chars = 0
+                follow_up = None
+                try:
+                    async for chunk in chunks:
+                        full_response.append(chunk)
+                        chars += len(chunk)
+                        progress["chars"] += len(chunk)
+                        queue.put_nowait({"type": "text", "content": chunk, **tag})
+                        # Overlap the follow-up call with the rest of the answer
+                        if follow_up is None and chars >= FOLLOW_UP_CONTEXT_CHARS:
+                            follow_up = start_follow_ups(agent_key, "".join(full_response))
+                except Exception as e:
+                    failed.add(agent_key)
+                    queue.put_nowait({"type": "error", "content": str(e), **tag})
+                complete_response = "".join(full_response)
+                if follow_up is None and complete_response:
+                    follow_up = start_follow_ups(agent_key, complete_response)
+                return complete_response, follow_up
+
+            # Total latency is the slowest agent, not the sum
+            failed: set[str] = set()
+            responses = await asyncio.gather(*(relay(key, chunks) for key, chunks in runs))
+            if cacheable and cached_answer is None and target not in failed:
+                answer_cache.record(target, user_content, responses[0][0])
+
+            pending = []
+            for (agent_key, _), (complete_response, follow_up) in zip(runs, responses):
+                if complete_response:
+                    await context_store.add_message(
+                        session_id, "assistant", AGENT_REGISTRY[agent_key].name, complete_response
+                    )
+                if follow_up is not None:
+                    pending.append((agent_key, follow_up))
+
+            # The answer is complete: `done` goes out now and follow-ups trail it
+            queue.put_nowait(sse.DONE)
+
+            progress["stage"] = "follow_ups"
+            for agent_key, follow_up in pending:
+                try:
+                    follow_ups = await asyncio.wait_for(follow_up, FOLLOW_UP_TIMEOUT)
+                except asyncio.TimeoutError:
+                    metrics.incr("follow_ups.timeouts")
+                    continue
+                if follow_ups:
+                    queue.put_nowait({"type": "follow_up", "agent_key": agent_key, "questions": follow_ups})
+        finally:
+            if cacheable and cached_answer is None:
+                answer_cache.record(target, user_content, None)  # no-op once recorded
+            for task in follow_up_tasks:
+                task.cancel()
+            queue.put_nowait(None)
+
+    # The generation is owned by a replayable stream, not by the connection
+    async def generate():
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(produce(queue))
+        try:
+            frames = sse.coalesce(
+                queue, _settings.sse_coalesce_ms / 1000, _settings.sse_coalesce_max_chars
+            )
+            async with aclosing(frames):
+                async for frame in frames:
+                    stream.append(frame)
+        finally:
+            stream.finish()
+            if not producer.done() or producer.cancelled():
+                producer.cancel()
+                metrics.incr("chat.cancelled")
+                metrics.incr(f"chat.cancelled.{progress['stage']}")
+                metrics.observe("chat.cancelled_chars", progress["chars"])
+                logger.info(
+                    "Stream for session %s abandoned during %s after %d chars; work cancelled",
+                    session_id, progress["stage"], progress["chars"],
+                )
+
+    stream = response_streams.create()
+    stream.task = asyncio.create_task(generate())
+
+    response = StreamingResponse(_follow(http_request, stream), media_type="text/event-stream")
     response.set_cookie(
         key="bio_session",
         value=session_id,
@@ -155,6 +399,19 @@ async def chat(request: ChatRequest):
     return response
 
 
+@router.get("/chat/resume")
+async def resume_chat(http_request: Request, last_event_id: str | None = Header(default=None)):
+    """Reconnect to a chat response: replay frames after Last-Event-ID
+    ("<stream_id>:<seq>") and follow the generation if it is still running."""
+    stream_id, _, seq = (last_event_id or "").rpartition(":")
+    stream = response_streams.get(stream_id)
+    if stream is None or not seq.isdigit() or not stream.can_resume(int(seq)):
+        metrics.incr("sse.resume.misses")
+        return JSONResponse({"error": "Stream expired"}, status_code=410)
+    metrics.incr("sse.resume.hits")
+    return StreamingResponse(_follow(http_request, stream, int(seq)), media_type="text/event-stream")
+
+
 @router.get("/suggested")
 async def suggested_questions(agent: str = "cfo"):
     pool = SUGGESTED_QUESTIONS.get(agent, [])
@@ -164,7 +421,8 @@ async def suggested_questions(agent: str = "cfo"):
 @router.delete("/session")
 async def clear_session(bio_session: str = Cookie(default=None)):
     if bio_session:
-        context_store.clear(bio_session)
+        await context_store.clear(bio_session)
+        tool_memo.clear(bio_session)
     response = JSONResponse({"cleared": True})
     response.delete_cookie("bio_session")
     return response
@@ -3,14 +3,17 @@ Settings API — password-protected configuration for data sources.
 """
 import hashlib
 import hmac
+import re
 from pathlib import Path
 
 from fastapi import APIRouter, Cookie, File, HTTPException, UploadFile
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from api.answer_cache import answer_cache
 from config import get_settings
 from tools import settings_store
+from tools.kb_loader import kb_index
 
 router = APIRouter()
 
@@ -88,6 +91,7 @@ async def save_farmer(req: FarmerSettings, settings_auth: str = Cookie(default=N
     data["farmer"]["runs_url"] = req.runs_url.strip()
     data["farmer"]["treatments_url"] = req.treatments_url.strip()
     settings_store.save(data)
+    answer_cache.refresh()
     return {"ok": True}
 
 
@@ -95,6 +99,8 @@ async def save_farmer(req: FarmerSettings, settings_auth: str = Cookie(default=N
 
 class DesignerSettings(BaseModel):
     replicate_version: str = ""
+    kb_token_budget: int | None = None
+    kb_inline_max_chars: int | None = None  # 0 disables inlining the KB
 
 
 @router.post("/settings/designer")
@@ -104,10 +110,67 @@ async def save_designer(
     _require_auth(settings_auth)
     data = settings_store.load()
     data["designer"]["replicate_version"] = req.replicate_version.strip()
+    if req.kb_token_budget is not None:
+        data["designer"]["kb_token_budget"] = max(200, req.kb_token_budget)
+    if req.kb_inline_max_chars is not None:
+        data["designer"]["kb_inline_max_chars"] = max(0, req.kb_inline_max_chars)
     settings_store.save(data)
+    answer_cache.refresh()
     return {"ok": True}
 
 
+# ─── Model selection policy (agents/model_policy.py) ──────────
+
+class ModelPolicySettings(BaseModel):
+    mode: str | None = None  # "auto" | "fixed"
+    default_model: str | None = None
+    fast_model: str | None = None
+    fast_max_chars: int | None = None
+    fast_patterns: list[str] | None = None
+
+
+@router.post("/settings/model_policy/{agent}")
+async def save_model_policy(
+    agent: str, req: ModelPolicySettings, settings_auth: str = Cookie(default=None)
+):
+    _require_auth(settings_auth)
+    if agent not in settings_store.DEFAULTS:
+        raise HTTPException(status_code=404, detail="Unknown agent")
+    if req.mode is not None and req.mode not in ("auto", "fixed"):
+        raise HTTPException(status_code=400, detail="mode must be 'auto' or 'fixed'")
+    for pattern in req.fast_patterns or []:
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid pattern {pattern!r}: {e}")
+    data = settings_store.load()
+    policy = data[agent].setdefault("model_policy", {})
+    policy.update(req.model_dump(exclude_none=True))
+    settings_store.save(data)
+    answer_cache.refresh()
+    return {"ok": True, "model_policy": policy}
+
+
+# ─── History token budget (session/compaction.py) ─────────────
+
+class HistorySettings(BaseModel):
+    token_budget: int
+
+
+@router.post("/settings/history/{agent}")
+async def save_history_budget(
+    agent: str, req: HistorySettings, settings_auth: str = Cookie(default=None)
+):
+    _require_auth(settings_auth)
+    if agent not in settings_store.DEFAULTS:
+        raise HTTPException(status_code=404, detail="Unknown agent")
+    data = settings_store.load()
+    data[agent]["history_token_budget"] = max(500, req.token_budget)
+    settings_store.save(data)
+    answer_cache.refresh()
+    return {"ok": True, "history_token_budget": data[agent]["history_token_budget"]}
+
+
 # ─── CFO — TEM model upload ────────────────────────────────────
 
 @router.post("/settings/upload/tem")
@@ -120,9 +183,11 @@ async def upload_tem(
         raise HTTPException(status_code=400, detail="Only .md files accepted")
     dest = KB_DIR / "tem_model.md"
     dest.write_bytes(await file.read())
+    kb_index.update_file(dest.name)
     data = settings_store.load()
     data["cfo"]["tem_model_file"] = "tem_model.md"
     settings_store.save(data)
+    answer_cache.refresh()
     return {"ok": True, "filename": "tem_model.md"}
 
 
@@ -138,6 +203,8 @@ async def upload_kb(
         raise HTTPException(status_code=400, detail="Only .md files accepted")
     safe_name = Path(file.filename or "upload.md").name
     (KB_DIR / safe_name).write_bytes(await file.read())
+    kb_index.update_file(safe_name)
+    answer_cache.refresh()
     return {"ok": True, "filename": safe_name}
 
 
@@ -147,4 +214,6 @@ async def delete_kb(filename: str, settings_auth: str = Cookie(default=None)):
     target = KB_DIR / Path(filename).name  # prevent path traversal
     if target.exists():
         target.unlink()
+    kb_index.remove_file(target.name)
+    answer_cache.refresh()
     return {"ok": True}
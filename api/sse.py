@@ -0,0 +1,85 @@
+"""
+Server-sent event framing for the chat stream.
+
+Events are queued as dicts and framed here. Consecutive text deltas for the
+same agent are coalesced for up to `window` seconds (or until `max_chars`)
+so a fast model produces a few larger frames instead of one small write and
+one browser re-render per token. Fixed events use pre-built frames.
+"""
+import asyncio
+import json
+
+import metrics
+
+try:
+    import orjson
+
+    def _dumps(payload: dict) -> bytes:
+        return orjson.dumps(payload)
+except ImportError:  # stdlib fallback
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def _dumps(payload: dict) -> bytes:
+        return _encoder.encode(payload).encode()
+
+
+def frame(payload: dict) -> bytes:
+    return b"data: " + _dumps(payload) + b"\n\n"
+
+
+DONE = frame({"type": "done"})
+
+
+async def coalesce(queue: asyncio.Queue, window: float, max_chars: int):
+    """
+    Yield SSE frames for the events on `queue` until None is received.
+    Items are event dicts or pre-built frames (bytes). window=0 disables
+    coalescing.
+    """
+    loop = asyncio.get_running_loop()
+    pending: dict[str | None, dict] = {}  # agent_key -> text event being accumulated
+    deadline = 0.0
+    frames = 0
+
+    def emit(payload) -> bytes:
+        nonlocal frames
+        data = payload if isinstance(payload, bytes) else frame(payload)
+        frames += 1
+        metrics.observe("sse.frame_bytes", len(data))
+        return data
+
+    try:
+        while True:
+            if not pending:
+                item = await queue.get()
+            else:
+                try:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    for event in pending.values():
+                        yield emit(event)
+                    pending.clear()
+                    continue
+
+            if window and isinstance(item, dict) and item.get("type") == "text":
+                key = item.get("agent_key")
+                event = pending.get(key)
+                if event is None:
+                    if not pending:
+                        deadline = loop.time() + window
+                    event = pending[key] = dict(item)
+                else:
+                    event["content"] += item["content"]
+                if len(event["content"]) >= max_chars:
+                    yield emit(pending.pop(key))
+                continue
+
+            # Anything else flushes buffered text first to keep ordering
+            for event in pending.values():
+                yield emit(event)
+            pending.clear()
+            if item is None:
+                return
+            yield emit(item)
+    finally:
+        metrics.observe("sse.frames_per_response", frames)
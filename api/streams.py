@@ -0,0 +1,160 @@
+"""
+Replayable chat response streams.
+
+Each chat response runs as a task that writes numbered SSE frames
+(`id: <stream_id>:<seq>`) into a bounded in-memory buffer. Connections
+follow the buffer, so a client that drops mid-answer can reconnect with
+Last-Event-ID and either replay what it missed or attach to the still
+running generation, without any new model work. A generation nobody is
+listening to is cancelled after a grace period; finished streams are kept
+for a TTL. Buffers live in the worker process that generated them, so with
+several uvicorn workers a resume must reach the same worker (sticky routing).
+"""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import metrics
+from config import get_settings
+
+
+class Listener:
+    """One connection following a stream."""
+
+    __slots__ = ("wake", "gone")
+
+    def __init__(self):
+        self.wake = asyncio.Event()
+        self.gone = False
+
+    def close(self):
+        self.gone = True
+        self.wake.set()
+
+
+class ResponseStream:
+    def __init__(self, stream_id: str, max_bytes: int, grace: float):
+        self.id = stream_id
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.finished = False
+        self.updated = time.monotonic()
+        self.task: asyncio.Task | None = None
+        self._frames: deque[bytes] = deque()
+        self._first = 1  # seq of _frames[0]
+        self._bytes = 0
+        self._listeners: set[Listener] = set()
+        self._abandon_timer: asyncio.TimerHandle | None = None
+
+    @property
+    def last_seq(self) -> int:
+        return self._first + len(self._frames) - 1
+
+    def append(self, frame: bytes):
+        framed = f"id: {self.id}:{self.last_seq + 1}\n".encode() + frame
+        self._frames.append(framed)
+        self._bytes += len(framed)
+        while self._bytes > self.max_bytes and len(self._frames) > 1:
+            self._bytes -= len(self._frames.popleft())
+            self._first += 1
+            metrics.incr("sse.replay.dropped_frames")
+        self._notify()
+
+    def finish(self):
+        self.finished = True
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        self._notify()
+
+    def can_resume(self, after: int) -> bool:
+        """True if every frame after `after` is still in the buffer."""
+        return self._first - 1 <= after <= self.last_seq
+
+    def attach(self) -> Listener:
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        listener = Listener()
+        self._listeners.add(listener)
+        return listener
+
+    def detach(self, listener: Listener):
+        self._listeners.discard(listener)
+        if not self._listeners and not self.finished and self._abandon_timer is None:
+            self._abandon_timer = asyncio.get_running_loop().call_later(self.grace, self._abandon)
+
+    async def follow(self, after: int, listener: Listener):
+        """Yield frames with seq > after, then live frames until the stream finishes.
+        A listener that falls so far behind that its next frame was evicted is
+        ended instead of skipping ahead: the client's resume then gets a 410
+        rather than a silently incomplete answer."""
+        cursor = after
+        while True:
+            listener.wake.clear()
+            while cursor < self.last_seq:
+                cursor += 1
+                if cursor < self._first:
+                    metrics.incr("sse.replay.overrun")
+                    listener.close()
+                    return
+                yield self._frames[cursor - self._first]
+            if self.finished or listener.gone:
+                return
+            await listener.wake.wait()
+
+    def _notify(self):
+        self.updated = time.monotonic()
+        for listener in self._listeners:
+            listener.wake.set()
+
+    def _abandon(self):
+        self._abandon_timer = None
+        if not self._listeners and self.task is not None and not self.task.done():
+            metrics.incr("sse.abandoned")
+            self.task.cancel()
+
+
+class StreamRegistry:
+    def __init__(self, ttl: float, max_streams: int, max_bytes: int, grace: float):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self._streams: OrderedDict[str, ResponseStream] = OrderedDict()
+
+    def create(self) -> ResponseStream:
+        self._evict()
+        stream = ResponseStream(uuid.uuid4().hex, self.max_bytes, self.grace)
+        self._streams[stream.id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> ResponseStream | None:
+        self._evict()
+        return self._streams.get(stream_id)
+
+    def _evict(self):
+        """Drop finished streams past their TTL, and the oldest finished ones over the cap."""
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if stream.finished and now - stream.updated > self.ttl:
+                del self._streams[stream_id]
+        excess = len(self._streams) - self.max_streams
+        for stream_id, stream in list(self._streams.items()):
+            if excess <= 0:
+                break
+            if stream.finished:
+                del self._streams[stream_id]
+                excess -= 1
+
+
+_settings = get_settings()
+
+# Singleton
+response_streams = StreamRegistry(
+    ttl=_settings.sse_replay_ttl,
+    max_streams=_settings.sse_replay_max_streams,
+    max_bytes=_settings.sse_replay_max_bytes,
+    grace=_settings.sse_resume_grace,
+)
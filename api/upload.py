@@ -1,11 +1,23 @@
 """
 Image upload endpoint — stores uploaded images for Designer agent analysis.
+
+The multipart body is parsed as it streams in and the file part is written
+to a temp file in data/uploads, so memory use stays at one chunk per upload
+and oversized bodies are rejected as soon as they pass MAX_SIZE_BYTES. The
+type is taken from the file's magic bytes, not its name. Files are stored
+under the sha256 of their content, so re-uploading the same photo reuses the
+stored file (and its cached Replicate prediction, see tools/replicate_client).
 """
-import uuid
+import hashlib
+import os
+import tempfile
 from pathlib import Path
 
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import FileResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+import metrics
 
 router = APIRouter()
 
@@ -14,22 +26,129 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
 MAX_SIZE_BYTES = 10 * 1024 * 1024  # 10 MB
+MULTIPART_OVERHEAD = 16 * 1024  # boundaries and part headers around the file
+
+
+def _sniff(head: bytes) -> str | None:
+    """Image extension from the first bytes of the file, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def _reject(reason: str, status_code: int, detail: str) -> HTTPException:
+    metrics.incr(f"uploads.rejected.{reason}")
+    return HTTPException(status_code=status_code, detail=detail)
+
+
+class _FilePart:
+    """Multipart callbacks that write the first file part to `out`."""
+
+    def __init__(self, out):
+        self.out = out
+        self.size = 0
+        self.head = b""
+        self.sha256 = hashlib.sha256()
+        self.found = False
+        self._in_file = False
+        self._headers: dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_file = not self.found and (params.get(b"name") == b"file" or b"filename" in params)
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if not self._in_file:
+            return
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > MAX_SIZE_BYTES:
+            raise _reject("size", 413, "File too large. Max 10 MB.")
+        if len(self.head) < 12:
+            self.head += chunk[:12 - len(self.head)]
+        self.sha256.update(chunk)
+        self.out.write(chunk)
+
+    def _part_end(self):
+        if self._in_file:
+            self.found = True
+            self._in_file = False
 
 
 @router.post("/upload/image")
-async def upload_image(file: UploadFile = File(...)):
-    suffix = Path(file.filename or "image.jpg").suffix.lower()
-    if suffix not in ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File type not allowed. Use: {', '.join(ALLOWED_EXTENSIONS)}",
-        )
-    content = await file.read()
-    if len(content) > MAX_SIZE_BYTES:
-        raise HTTPException(status_code=400, detail="File too large. Max 10 MB.")
-
-    image_id = f"{uuid.uuid4()}{suffix}"
-    (UPLOAD_DIR / image_id).write_bytes(content)
+async def upload_image(request: Request):
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > MAX_SIZE_BYTES + MULTIPART_OVERHEAD:
+        raise _reject("size", 413, "File too large. Max 10 MB.")  # before reading the body
+
+    # Temp file in the upload dir so the final os.replace is atomic
+    fd, tmp_name = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            part = _FilePart(out)
+            parser = MultipartParser(boundary, part.callbacks())
+            async for chunk in request.stream():
+                parser.write(chunk)
+            parser.finalize()
+
+        if not part.found or not part.size:
+            raise HTTPException(status_code=400, detail="No file uploaded")
+        suffix = _sniff(part.head)
+        if suffix is None:
+            raise _reject(
+                "type",
+                400,
+                f"File type not allowed. Use: {', '.join(sorted(ALLOWED_EXTENSIONS))}",
+            )
+
+        image_id = f"{part.sha256.hexdigest()}{suffix}"
+        target = UPLOAD_DIR / image_id
+        if target.exists():
+            Path(tmp_name).unlink()  # same content already stored
+            metrics.incr("uploads.dedupe")
+        else:
+            os.replace(tmp_name, target)
+            metrics.incr("uploads.stored")
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    metrics.observe("uploads.bytes", part.size)
     return {"image_id": image_id}
 
 
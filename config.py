@@ -6,6 +6,43 @@ class Settings(BaseSettings):
     anthropic_api_key: str = ""
     replicate_api_token: str = ""
     admin_password: str = "admin"
+    log_level: str = "INFO"
+
+    # Shared Anthropic client (agents/client.py)
+    anthropic_max_connections: int = 50
+    anthropic_max_keepalive: int = 20
+    anthropic_keepalive_expiry: float = 60.0
+    anthropic_timeout: float = 600.0
+    anthropic_connect_timeout: float = 10.0
+    anthropic_max_retries: int = 2
+
+    # Admission control for model calls (agents/admission.py); 0 TPM = unlimited
+    model_max_concurrency: int = 8
+    model_tokens_per_minute: int = 0
+
+    # Tool execution pools (tools/executor.py); 0 = min(4, CPU count)
+    tool_thread_workers: int = 16
+    tool_process_workers: int = 0
+
+    # SSE text delta coalescing (api/sse.py); 0 ms = one frame per delta
+    sse_coalesce_ms: int = 40
+    sse_coalesce_max_chars: int = 2048
+
+    # Resumable chat streams (api/streams.py)
+    sse_replay_ttl: float = 300.0  # keep finished streams this long for reconnects
+    sse_replay_max_streams: int = 256
+    sse_replay_max_bytes: int = 1_000_000  # per stream
+    sse_resume_grace: float = 30.0  # cancel a generation nobody has followed for this long
+
+    # Session storage (session/backends.py): "memory" (single worker), or
+    # "sqlite" / "shm" (SQLite WAL in data/ or /dev/shm) to share sessions
+    # between uvicorn workers (WEB_CONCURRENCY). Empty path = backend default.
+    session_backend: str = "memory"
+    session_db_path: str = ""
+
+    # Pre-warmed answers to SUGGESTED_QUESTIONS (api/answer_cache.py)
+    answer_cache_enabled: bool = True
+    answer_cache_interval: float = 60.0  # seconds between data version checks
 
     class Config:
         env_file = ".env"
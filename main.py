@@ -1,11 +1,54 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+import metrics
+from agents import client as anthropic_client
+from agents.memo import tool_memo
+from api.answer_cache import answer_cache
 from api.chat import router as chat_router
 from api.settings import router as settings_router
 from api.upload import router as upload_router
+from config import get_settings
+from session.context_store import context_store
+from tools import executor, replicate_client
+from tools.kb_loader import kb_index
+
+logging.basicConfig(
+    level=get_settings().log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+
 
-app = FastAPI(title="bio-agents")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reconcile the KB index with data/kb before serving searches
+    kb_index.sync()
+    kb_task = asyncio.create_task(kb_index.run())
+    # Spawn the cpu tool workers now, not on the first TEM / Farmer call
+    pool_task = asyncio.create_task(
+        executor.startup(("tools.cfo_calculator", "tools.farmer_analytics", "tools.farmer_schema"))
+    )
+    await anthropic_client.startup()
+    settings = get_settings()
+    warm_task = None
+    if settings.answer_cache_enabled:
+        warm_task = asyncio.create_task(answer_cache.run(settings.answer_cache_interval))
+    try:
+        yield
+    finally:
+        kb_task.cancel()
+        pool_task.cancel()
+        if warm_task is not None:
+            warm_task.cancel()
+        await anthropic_client.shutdown()
+        executor.shutdown()
+
+
+app = FastAPI(title="bio-agents", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -33,4 +76,19 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        **metrics.snapshot(),
+        "sessions": await context_store.stats(),
+        "rates": {
+            "tool_memo": tool_memo.hit_rate(),
+            "follow_ups": metrics.ratio("follow_ups.cache_hits", "follow_ups.cache_misses"),
+            "answer_cache": answer_cache.hit_rate(),
+            "replicate_cache": replicate_client.hit_rate(),
+            "uploads_dedupe": metrics.ratio("uploads.dedupe", "uploads.stored"),
+        },
+    }
+
+
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
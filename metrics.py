@@ -0,0 +1,44 @@
+"""
+In-process performance counters and value summaries.
+Cheap enough to call on hot paths; exposed as JSON at GET /metrics.
+"""
+import threading
+
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_summaries: dict[str, list[float]] = {}  # name -> [count, total, max]
+
+
+def incr(name: str, n: float = 1) -> None:
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name: str, value: float) -> None:
+    """Record one sample of a value (latency, size, ...)."""
+    with _lock:
+        s = _summaries.get(name)
+        if s is None:
+            _summaries[name] = [1, value, value]
+        else:
+            s[0] += 1
+            s[1] += value
+            s[2] = max(s[2], value)
+
+
+def ratio(hits: str, misses: str) -> float | None:
+    """Hit rate from two counters, or None before any traffic."""
+    with _lock:
+        h, m = _counters.get(hits, 0), _counters.get(misses, 0)
+    return h / (h + m) if h + m else None
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "summaries": {
+                name: {"count": c, "avg": total / c, "max": mx}
+                for name, (c, total, mx) in _summaries.items()
+            },
+        }
@@ -0,0 +1,156 @@
+"""
+Local fast-path intent classifier (multinomial naive Bayes).
+Trained on the suggested questions, a few keyword seeds and logged routing
+decisions (explicit @mentions and Haiku answers), of which only the latest
+MAX_LOG_EXAMPLES are kept, at startup and while running alike. Confident cases
+are decided in-process in microseconds; uncertain ones fall back to the Haiku
+router.
+Short follow-ups that only make sense with the conversation ("and then?")
+are never learned from: their label came from context the model cannot see.
+"""
+import json
+import math
+import re
+import threading
+from collections import deque
+from pathlib import Path
+
+from tools.jsonl_log import JsonlLog
+
+LABELS = ("designer", "farmer", "cfo")
+ROUTING_LOG = Path(__file__).parent.parent / "data" / "routing_log.jsonl"
+ROUTING_LOG_MAX_BYTES = 2 * 1024 * 1024
+MAX_LOG_EXAMPLES = 5000  # learned decisions kept; older ones are unlearned
+CONFIDENCE_THRESHOLD = 0.9
+MIN_FOLLOW_UP_WORDS = 6  # shorter mid-conversation messages are not learned from
+
+_WORD_RE = re.compile(r"[a-z0-9$%]+")
+
+# Keyword seeds mirroring the Haiku router's agent descriptions
+SEED_EXAMPLES = {
+    "designer": [
+        "material design bacterial cellulose pellicle properties",
+        "image analysis tensile strength elongation stiffness uniformity",
+        "experiment design doe hypothesis material readiness mr-1 mr-2 mr-3",
+        "drying plasticizer surface treatment flexibility texture aesthetic",
+    ],
+    "farmer": [
+        "production data yields recipes spreadsheets runs csv",
+        "fermentation runs treatments dataset fields schema coverage",
+        "yield per m2 dry mass thickness defects contamination by recipe",
+        "trend anomaly best recipe 2024 2025 table",
+    ],
+    "cfo": [
+        "costs revenue profit financial model tem scenarios",
+        "npv roi payback ebitda margin break even price per kg",
+        "capex opex capacity utilization tonnes raw material cost",
+        "techno-economic scenario defaults profit per kg sensitivity",
+    ],
+}
+
+
+def learnable(text: str, had_context: bool) -> bool:
+    """True if a labelled message can be learned from without its conversation."""
+    return not had_context or len(_WORD_RE.findall(text.lower())) >= MIN_FOLLOW_UP_WORDS
+
+
+def _features(text: str) -> list[str]:
+    words = _WORD_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class LocalClassifier:
+    def __init__(self):
+        self._counts = {label: {} for label in LABELS}
+        self._totals = dict.fromkeys(LABELS, 0)
+        self._docs = dict.fromkeys(LABELS, 0)
+        self._vocab: dict[str, int] = {}  # feature -> occurrences over all labels
+        self._learned: deque[tuple[str, str]] = deque()  # (text, label), oldest first
+        self._log_loaded = False
+        self._lock = threading.Lock()
+
+    def add_example(self, text: str, label: str):
+        """Train on a fixed example (seeds, suggested questions); never evicted."""
+        if label not in self._counts:
+            return
+        with self._lock:
+            self._count(text, label, 1)
+
+    def learn(self, text: str, label: str):
+        """Train on a logged routing decision. Past MAX_LOG_EXAMPLES the oldest
+        learned decision is taken back out, so the model stays the size of the
+        capped log however long the process runs."""
+        if label not in self._counts:
+            return
+        with self._lock:
+            self._count(text, label, 1)
+            self._learned.append((text, label))
+            if len(self._learned) > MAX_LOG_EXAMPLES:
+                self._count(*self._learned.popleft(), -1)
+
+    def add_examples(self, examples: dict[str, list[str]]):
+        for label, texts in examples.items():
+            for text in texts:
+                self.add_example(text, label)
+
+    def _count(self, text: str, label: str, delta: int):
+        counts = self._counts[label]
+        for f in _features(text):
+            counts[f] = counts.get(f, 0) + delta
+            if not counts[f]:
+                del counts[f]
+            self._vocab[f] = self._vocab.get(f, 0) + delta
+            if not self._vocab[f]:
+                del self._vocab[f]
+            self._totals[label] += delta
+        self._docs[label] += delta
+
+    def load_log(self, log: JsonlLog | None = None):
+        """Train on logged mention/Haiku decisions (never on our own guesses)."""
+        self._log_loaded = True
+        for line in (log or routing_log).read_lines()[-MAX_LOG_EXAMPLES:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            text = entry.get("text", "")
+            # Entries logged before the context flag existed: assume context
+            if entry.get("source") in ("mention", "haiku") and learnable(text, entry.get("context", True)):
+                self.learn(text, entry.get("agent", ""))
+
+    def predict(self, text: str) -> tuple[str | None, float]:
+        """Return (label, posterior probability); label is None if nothing is known."""
+        if not self._log_loaded:
+            self.load_log()
+        feats = [f for f in _features(text) if f in self._vocab]
+        if not feats:
+            return None, 0.0
+        with self._lock:
+            n_docs = sum(self._docs.values()) or 1
+            v = len(self._vocab)
+            scores = {}
+            for label in LABELS:
+                counts, total = self._counts[label], self._totals[label]
+                s = math.log((self._docs[label] + 1) / (n_docs + len(LABELS)))
+                for f in feats:
+                    s += math.log((counts.get(f, 0) + 1) / (total + v))
+                scores[label] = s
+        top = max(scores.values())
+        norm = sum(math.exp(s - top) for s in scores.values())
+        best = max(scores, key=scores.get)
+        return best, 1.0 / norm
+
+
+def log_decision(text: str, agent: str, source: str, context: bool):
+    """Queue a labelled routing decision ("mention" | "haiku") for future training.
+    context: whether the message had conversation history when it was labelled."""
+    routing_log.append({"text": text[:500], "agent": agent, "source": source, "context": context})
+
+
+# Size-capped and written in the background (tools/jsonl_log.py)
+routing_log = JsonlLog(ROUTING_LOG, ROUTING_LOG_MAX_BYTES)
+
+
+# Singleton, seeded here; api.chat adds SUGGESTED_QUESTIONS at import
+local_classifier = LocalClassifier()
+local_classifier.add_examples(SEED_EXAMPLES)
@@ -1,5 +1,5 @@
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 MENTION_PATTERN = re.compile(r"@(designer|farmer|cfo)\b", re.IGNORECASE)
@@ -11,19 +11,22 @@ class ParsedMessage:
     clean_text: str
     has_image: bool
     image_id: str | None
+    target_agents: list[str] = field(default_factory=list)  # every distinct @mention, in order
 
 
 def parse_message(raw_text: str, image_id: str | None = None) -> ParsedMessage:
     """
-    Extract @mention from message text.
+    Extract @mentions from message text.
+    target_agent is the first mention; target_agents lists all distinct ones.
     Falls back to 'designer' if an image is attached with no @mention.
     Returns None target if no mention and no image (caller must classify).
     """
-    match = MENTION_PATTERN.search(raw_text)
-    target = match.group(1).lower() if match else None
+    targets = list(dict.fromkeys(m.lower() for m in MENTION_PATTERN.findall(raw_text)))
+    target = targets[0] if targets else None
 
     if target is None and image_id:
         target = "designer"
+        targets = [target]
 
     clean = MENTION_PATTERN.sub("", raw_text).strip()
     return ParsedMessage(
@@ -31,4 +34,5 @@ def parse_message(raw_text: str, image_id: str | None = None) -> ParsedMessage:
         clean_text=clean,
         has_image=image_id is not None,
         image_id=image_id,
+        target_agents=targets,
     )
@@ -1,9 +1,22 @@
 """
 Orchestrator: classifies which agent to use when no @mention is present.
-Uses a fast, cheap Claude call with minimal tokens.
+Confident cases are decided by the local classifier; the rest use a fast,
+cheap Claude call with minimal, truncated context. The local classifier sees
+only the new message, so mid-conversation it is trusted only when it agrees
+with the session's current agent; otherwise Haiku decides with the history.
 """
-import anthropic
-from config import get_settings
+import metrics
+from agents.admission import PRIORITY_SHORT, admission
+from agents.client import get_client
+from router.local_classifier import (
+    CONFIDENCE_THRESHOLD,
+    learnable,
+    local_classifier,
+    log_decision,
+)
+
+CONTEXT_MESSAGES = 4  # recent history sent to Haiku (keep even: user/assistant pairs)
+CONTEXT_CHARS = 300  # per-message truncation for the Haiku call
 
 CLASSIFIER_SYSTEM = """You route user messages to one of three agents.
 Reply with exactly one word — no punctuation, no explanation:
@@ -12,25 +25,55 @@ Reply with exactly one word — no punctuation, no explanation:
   cfo       (costs, revenue, profit, financial model, TEM, scenarios)"""
 
 
+def classify_local(new_message: str, history: list[dict], sticky: str | None = None) -> str | None:
+    """
+    Return the agent if the local classifier is confident, else None. With
+    history, only a confident answer equal to `sticky` (the session's current
+    agent) is taken: "show me the data" means something else mid-conversation.
+    """
+    label, confidence = local_classifier.predict(new_message)
+    if label is None or confidence < CONFIDENCE_THRESHOLD:
+        return None
+    if history and label != sticky:
+        metrics.incr("router.local_deferred")
+        return None
+    metrics.incr("router.local")  # not logged: never trained on, and it is user text
+    return label
+
+
 async def classify_agent(history: list[dict], new_message: str) -> str:
     """
     Returns 'designer', 'farmer', or 'cfo' based on conversation context.
     Falls back to 'cfo' on any error.
     """
-    client = anthropic.AsyncAnthropic(api_key=get_settings().anthropic_api_key)
+    return classify_local(new_message, history) or await classify_remote(history, new_message)
+
+
+async def classify_remote(history: list[dict], new_message: str) -> str:
+    """Haiku classification with compact context. Falls back to 'cfo' on any error."""
+    metrics.incr("router.haiku")
+    client = get_client()
 
-    # Use last 6 messages for context, keep it cheap
-    context = history[-6:] + [{"role": "user", "content": new_message}]
+    # Compact context: last few messages, each truncated, keep it cheap
+    context = [
+        {"role": m["role"], "content": str(m["content"])[:CONTEXT_CHARS]}
+        for m in history[-CONTEXT_MESSAGES:]
+    ] + [{"role": "user", "content": new_message[:CONTEXT_CHARS * 2]}]
 
     try:
-        response = await client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            system=CLASSIFIER_SYSTEM,
-            messages=context,
-            max_tokens=5,
-        )
+        est = (len(CLASSIFIER_SYSTEM) + sum(len(str(m["content"])) for m in context)) // 4
+        async with admission.slot(None, PRIORITY_SHORT, est + 5):
+            response = await client.messages.create(
+                model="claude-haiku-4-5-20251001",
+                system=CLASSIFIER_SYSTEM,
+                messages=context,
+                max_tokens=5,
+            )
         agent = response.content[0].text.strip().lower()
         if agent in ("designer", "farmer", "cfo"):
+            log_decision(new_message, agent, "haiku", bool(history))
+            if learnable(new_message, bool(history)):
+                local_classifier.learn(new_message, agent)
             return agent
     except Exception:
         pass
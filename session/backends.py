@@ -0,0 +1,418 @@
+"""
+Session storage backends for ContextStore.
+
+MemoryBackend keeps sessions in the process (single worker). SqliteBackend
+keeps them in a SQLite database in WAL mode so several uvicorn workers on
+one host share conversations; pointed at /dev/shm it is a shared-memory
+store. Both evict sessions idle for SESSION_TTL, beyond MAX_SESSIONS, or
+while stored text exceeds MAX_TOTAL_CHARS, counting evictions under
+sessions.evicted.<reason>.
+
+SqliteBackend only writes on the request path when a message is appended:
+reads are plain read transactions (never waiting on another worker's write
+lock), and read activity plus eviction sweeps are written in batches by a
+background thread with its own connection. An append can still wait up to
+busy_timeout for another writer, so it is a blocking backend: ContextStore
+runs its calls in a thread, off the event loop.
+"""
+import abc
+import itertools
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+import metrics
+
+MAX_MESSAGES = 50
+MAX_SESSIONS = 5000
+SESSION_TTL = 60 * 60 * 24  # seconds idle; matches the bio_session cookie
+MAX_TOTAL_CHARS = 50_000_000  # message text across all sessions
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+SHM_PATH = Path("/dev/shm/bio-agents-sessions.db")
+
+
+class Message:
+    __slots__ = ("role", "agent", "content", "timestamp", "summary")
+
+    def __init__(
+        self,
+        role: str,
+        agent: str,
+        content: str,
+        timestamp: float | None = None,
+        summary: str | None = None,
+    ):
+        self.role = sys.intern(role)
+        self.agent = sys.intern(agent)
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.summary = summary  # short form for old history (session/compaction.py)
+
+
+class SessionBackend(abc.ABC):
+    """
+    Storage interface used by ContextStore. A session's version changes on
+    every append (by any process), so callers can cache derived data per
+    (session, version); 0 means an empty or unknown session.
+    """
+
+    max_messages: int = MAX_MESSAGES
+    blocking: bool = False  # calls may wait on I/O or locks: run them in a thread
+    # Called with the id of each session this process evicts, from any thread
+    on_evict: Callable[[str], None] | None = None
+
+    @abc.abstractmethod
+    def append(self, session_id: str, message: Message) -> tuple[int, int]:
+        """Store message, trimming the oldest beyond max_messages. Returns the
+        session's (previous version, new version)."""
+
+    @abc.abstractmethod
+    def load(self, session_id: str) -> list[Message]:
+        """Messages oldest first; [] for unknown or expired sessions (never creates one)."""
+
+    @abc.abstractmethod
+    def version(self, session_id: str) -> int:
+        """Current version; reads count as activity, like load()."""
+
+    @abc.abstractmethod
+    def clear(self, session_id: str):
+        ...
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+# ─── In-process ───────────────────────────────────────────────
+
+class _Session:
+    __slots__ = ("messages", "chars", "touched", "version")
+
+    def __init__(self, max_messages: int):
+        self.messages: deque[Message] = deque(maxlen=max_messages)
+        self.chars = 0
+        self.touched = time.monotonic()
+        self.version = 0
+
+
+class MemoryBackend(SessionBackend):
+    def __init__(
+        self,
+        max_messages: int = MAX_MESSAGES,
+        max_sessions: int = MAX_SESSIONS,
+        ttl: float = SESSION_TTL,
+        max_total_chars: int = MAX_TOTAL_CHARS,
+    ):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_total_chars = max_total_chars
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._chars = 0
+        self._versions = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def append(self, session_id: str, message: Message) -> tuple[int, int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_messages)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.touched = time.monotonic()
+            if len(session.messages) == session.messages.maxlen:
+                dropped = len(session.messages[0].content)
+                session.chars -= dropped
+                self._chars -= dropped
+            session.messages.append(message)
+            session.chars += len(message.content)
+            self._chars += len(message.content)
+            previous, session.version = session.version, next(self._versions)
+            self._evict(keep=session_id)
+            return previous, session.version
+
+    def load(self, session_id: str) -> list[Message]:
+        with self._lock:
+            session = self._live(session_id)
+            return list(session.messages) if session else []
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            session = self._live(session_id)
+            return session.version if session else 0
+
+    def clear(self, session_id: str):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._chars -= session.chars
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "chars": self._chars}
+
+    def _live(self, session_id: str) -> _Session | None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.touched > self.ttl:
+            self._drop(session_id, "ttl")
+            return None
+        session.touched = now  # reads count as activity
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, session_id: str, reason: str):
+        session = self._sessions.pop(session_id)
+        self._chars -= session.chars
+        metrics.incr(f"sessions.evicted.{reason}")
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def _evict(self, keep: str):
+        # Oldest first: idle sessions, then LRU over the count and memory caps
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session_id == keep:
+                break
+            if now - session.touched > self.ttl:
+                self._drop(session_id, "ttl")
+            elif len(self._sessions) > self.max_sessions:
+                self._drop(session_id, "lru")
+            elif self._chars > self.max_total_chars:
+                self._drop(session_id, "memory")
+            else:
+                break
+
+
+# ─── Shared between processes ─────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id      TEXT PRIMARY KEY,
+    touched REAL NOT NULL,
+    chars   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched);
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    role    TEXT NOT NULL,
+    agent   TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session, id);
+"""
+
+
+@contextmanager
+def _write(db: sqlite3.Connection):
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    db.execute("COMMIT")
+
+
+class SqliteBackend(SessionBackend):
+    blocking = True
+    FLUSH_INTERVAL = 10.0  # seconds between writes of read activity (per process)
+    SWEEP_INTERVAL = 60.0  # seconds between TTL / cap sweeps (per process)
+
+    def __init__(
+        self,
+        path: Path,
+        max_messages: int = MAX_MESSAGES,
+        max_sessions: int = MAX_SESSIONS,
+        ttl: float = SESSION_TTL,
+        max_total_chars: int = MAX_TOTAL_CHARS,
+    ):
+        self.path = path
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_total_chars = max_total_chars
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(_SCHEMA)
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(messages)")}
+        if "summary" not in columns:  # databases created before history compaction
+            self._db.execute("ALTER TABLE messages ADD COLUMN summary TEXT")
+        self._lock = threading.Lock()
+        self._read_activity: dict[str, float] = {}  # session -> last read, not yet stored
+        threading.Thread(target=self._maintain, name="session-maintenance", daemon=True).start()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock, _write(self._db) as db:
+            yield db
+
+    @contextmanager
+    def _snapshot(self):
+        """Read transaction: a consistent view without taking the write lock."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                yield self._db
+            finally:
+                self._db.execute("COMMIT")
+
+    def append(self, session_id: str, message: Message) -> tuple[int, int]:
+        with self._transaction() as db:
+            previous = self._version(db, session_id)
+            cursor = db.execute(
+                "INSERT INTO messages (session, role, agent, content, ts, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, message.role, message.agent, message.content, message.timestamp, message.summary),
+            )
+            db.execute(
+                "INSERT INTO sessions (id, touched, chars) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET touched = excluded.touched, chars = chars + excluded.chars",
+                (session_id, time.time(), len(message.content)),
+            )
+            row = db.execute(
+                "SELECT id FROM messages WHERE session = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                (session_id, self.max_messages),
+            ).fetchone()
+            if row is not None:
+                (dropped,) = db.execute(
+                    "SELECT COALESCE(SUM(LENGTH(content)), 0) FROM messages WHERE session = ? AND id <= ?",
+                    (session_id, row[0]),
+                ).fetchone()
+                db.execute("DELETE FROM messages WHERE session = ? AND id <= ?", (session_id, row[0]))
+                db.execute("UPDATE sessions SET chars = chars - ? WHERE id = ?", (dropped, session_id))
+        return previous, cursor.lastrowid  # message ids grow across all processes
+
+    def load(self, session_id: str) -> list[Message]:
+        with self._snapshot() as db:
+            row = db.execute("SELECT touched FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None or not self._live(session_id, row[0]):
+                return []
+            rows = db.execute(
+                "SELECT role, agent, content, ts, summary FROM messages WHERE session = ? ORDER BY id",
+                (session_id,),
+            ).fetchall()
+        return [Message(*r) for r in rows]
+
+    def version(self, session_id: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT touched, (SELECT COALESCE(MAX(id), 0) FROM messages WHERE session = s.id) "
+                "FROM sessions s WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+        return row[1] if row is not None and self._live(session_id, row[0]) else 0
+
+    def _live(self, session_id: str, touched: float) -> bool:
+        """Whether a stored session is within the TTL; if so, record the read as
+        activity (stored by the maintenance thread). Call with self._lock held."""
+        now = time.time()
+        if now - max(touched, self._read_activity.get(session_id, 0.0)) > self.ttl:
+            return False  # expired; removed by the next sweep
+        self._read_activity[session_id] = now
+        return True
+
+    @staticmethod
+    def _version(db: sqlite3.Connection, session_id: str) -> int:
+        (version,) = db.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM messages WHERE session = ?", (session_id,)
+        ).fetchone()
+        return version
+
+    def clear(self, session_id: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._read_activity.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions, chars = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(chars), 0) FROM sessions"
+            ).fetchone()
+        return {"sessions": sessions, "chars": chars}
+
+    def _delete(self, db: sqlite3.Connection, session_ids: list[str], reason: str):
+        for session_id in session_ids:
+            db.execute("DELETE FROM messages WHERE session = ?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            if self.on_evict is not None:
+                self.on_evict(session_id)
+        if session_ids:
+            metrics.incr(f"sessions.evicted.{reason}", len(session_ids))
+
+    def _maintain(self):
+        """Background thread: store read activity every FLUSH_INTERVAL and sweep
+        every SWEEP_INTERVAL, on a separate connection."""
+        db = sqlite3.connect(self.path, isolation_level=None)
+        db.execute("PRAGMA busy_timeout=5000")
+        swept = time.monotonic()
+        while True:
+            time.sleep(self.FLUSH_INTERVAL)
+            try:
+                self._flush_activity(db)
+                if time.monotonic() - swept >= self.SWEEP_INTERVAL:
+                    swept = time.monotonic()
+                    self._sweep(db)
+            except sqlite3.Error:
+                metrics.incr("sessions.maintenance_errors")
+
+    def _flush_activity(self, db: sqlite3.Connection):
+        with self._lock:
+            activity, self._read_activity = self._read_activity, {}
+        if activity:
+            with _write(db):
+                db.executemany(
+                    "UPDATE sessions SET touched = MAX(touched, ?) WHERE id = ?",
+                    [(t, session_id) for session_id, t in activity.items()],
+                )
+
+    def _sweep(self, db: sqlite3.Connection):
+        """Evict idle sessions, then the least recently used over the count and memory caps."""
+        with _write(db):
+            expired = db.execute(
+                "SELECT id FROM sessions WHERE touched < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            self._delete(db, [r[0] for r in expired], "ttl")
+
+            (count,) = db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            if count > self.max_sessions:
+                oldest = db.execute(
+                    "SELECT id FROM sessions ORDER BY touched LIMIT ?", (count - self.max_sessions,)
+                ).fetchall()
+                self._delete(db, [r[0] for r in oldest], "lru")
+
+            (total,) = db.execute("SELECT COALESCE(SUM(chars), 0) FROM sessions").fetchone()
+            over = []
+            for session_id, chars in db.execute("SELECT id, chars FROM sessions ORDER BY touched"):
+                if total <= self.max_total_chars:
+                    break
+                over.append(session_id)
+                total -= chars
+            self._delete(db, over, "memory")
+
+
+def create_backend(kind: str, path: str = "") -> SessionBackend:
+    """Backend for the session_backend setting: "memory" | "sqlite" | "shm"."""
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SqliteBackend(Path(path) if path else DATA_DIR / "sessions.db")
+    if kind == "shm":
+        return SqliteBackend(Path(path) if path else SHM_PATH)
+    raise ValueError(f"Unknown session_backend {kind!r} (expected memory, sqlite or shm)")
@@ -0,0 +1,112 @@
+"""
+Token-budgeted history for agent prompts.
+
+History that fits the agent's budget ("<agent>.history_token_budget" in
+data/settings.json) is sent verbatim. Over budget, long answers (Farmer
+tables, TEM breakdowns) are replaced by a short extractive summary, computed
+once when the message is stored, a whole block at a time from the oldest,
+never touching the most recent KEEP_RECENT messages. If that is not enough the
+recent answers are summarised too, and then the oldest blocks are dropped.
+
+Working in blocks keeps the compacted history stable from one turn to the next:
+the summarised/dropped boundaries only move when the history outgrows them, so
+earlier messages stay byte-identical and the conversation-prefix cache
+breakpoint (agents/base.py) keeps hitting in between. Block boundaries sit
+before user turns picked by a hash of their text (about one in BLOCK_TURNS),
+so they do not shift when the store trims its oldest messages and every worker
+picks the same ones.
+"""
+import re
+import zlib
+
+from tools import settings_store
+
+DEFAULT_HISTORY_BUDGET = 6000  # tokens
+KEEP_RECENT = 4  # messages (two turns) always kept verbatim when they fit
+BLOCK_TURNS = 4  # average user turns per block
+SUMMARY_MIN_CHARS = 800  # shorter answers are kept as they are
+SUMMARY_MAX_CHARS = 400
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4  # tokens of role/formatting per message
+
+_TABLE_RE = re.compile(r"(?:^[ \t]*\|.*\|[ \t]*\n?)+", re.MULTILINE)
+_CODE_RE = re.compile(r"```.*?```", re.DOTALL)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD
+
+
+def history_budget(agent_key: str) -> int:
+    cfg = settings_store.load().get(agent_key, {})
+    return cfg.get("history_token_budget") or DEFAULT_HISTORY_BUDGET
+
+
+def _table_note(match: re.Match) -> str:
+    rows = [r for r in match.group(0).strip().splitlines() if not re.match(r"^\s*\|[\s:|-]+\|\s*$", r)]
+    columns = [c.strip() for c in rows[0].strip().strip("|").split("|")] if rows else []
+    return f"\n[table: {max(len(rows) - 1, 0)} rows; columns: {', '.join(columns)}]\n"
+
+
+def summarize(text: str) -> str | None:
+    """Short extractive summary of a long answer, or None if it is short already.
+    Tables and code blocks become one-line notes; the prose is cut to whole
+    sentences within SUMMARY_MAX_CHARS."""
+    if len(text) < SUMMARY_MIN_CHARS:
+        return None
+    text = _CODE_RE.sub("\n[code block]\n", text)
+    text = _TABLE_RE.sub(_table_note, text)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    out, size = [], 0
+    for sentence in _SENTENCE_RE.split(" ".join(lines)):
+        if size + len(sentence) > SUMMARY_MAX_CHARS:
+            break
+        out.append(sentence)
+        size += len(sentence) + 1
+    summary = " ".join(out) or " ".join(lines)[:SUMMARY_MAX_CHARS]
+    return f"(summarized) {summary}"
+
+
+def _is_block_start(entry: tuple) -> bool:
+    role, content, _ = entry
+    return role == "user" and zlib.crc32(content.encode()) % BLOCK_TURNS == 0
+
+
+def compact(
+    entries: list[tuple[str, str, str | None]], token_budget: int, trimmed: bool = False
+) -> list[dict]:
+    """
+    entries: (role, rendered content, rendered summary or None), oldest first.
+    trimmed: the store has been dropping the oldest messages, so the first
+    entry changes every turn; start at a block boundary instead.
+    Returns Claude-format messages within token_budget, starting with a user turn.
+    """
+    n = len(entries)
+    full = [estimate_tokens(content) for _, content, _ in entries]
+    short = [
+        estimate_tokens(summary) if summary is not None else size
+        for (_, _, summary), size in zip(entries, full)
+    ]
+
+    def size(start: int, boundary: int) -> int:
+        """Tokens with entries before `boundary` summarised and before `start` dropped."""
+        return sum(short[start:boundary]) + sum(full[max(start, boundary):])
+
+    cuts = [i for i, entry in enumerate(entries) if _is_block_start(entry)]
+    # Entries before `boundary` are summarised, before `start` dropped
+    boundary = next(
+        (b for b in [0] + cuts if b <= n - KEEP_RECENT and size(0, b) <= token_budget),
+        n,  # still over: summarise the recent answers as well
+    )
+    # Past the last block boundary, fall back to dropping single turns
+    tail = [i for i, (role, _, _) in enumerate(entries) if role == "user" and i > (cuts[-1] if cuts else 0)]
+    starts = ([] if trimmed and cuts else [0]) + cuts + tail
+    start = next((s for s in starts if size(s, boundary) <= token_budget), n)
+    while start < n and entries[start][0] != "user":
+        start += 1
+    return [
+        {"role": role, "content": content if i >= boundary or summary is None else summary}
+        for i, (role, content, summary) in enumerate(entries)
+        if i >= start
+    ]
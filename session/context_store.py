@@ -1,34 +1,178 @@
-from collections import defaultdict
-from datetime import datetime
+"""
+Conversation history per session, stored in a pluggable backend
+(session/backends.py): in-process by default, SQLite when several uvicorn
+workers must share sessions. Methods are coroutines: calls into a blocking
+backend (SQLite, whose appends may wait on another writer) run in a thread.
 
-MAX_MESSAGES = 50
+The Claude-format history is kept pre-rendered per session and updated
+incrementally on append (one rendered entry added, trimmed entries dropped
+from the front), so reads are O(1). Returned lists are shared: callers must
+not mutate them (BaseAgent copies before adding to a conversation). A cached
+history is dropped when the backend evicts its session, so the cache never
+holds conversations the backend's caps have already let go.
+"""
+import asyncio
+from collections import OrderedDict, deque
+from functools import reduce
+
+from config import get_settings
+from session.backends import Message, SessionBackend, create_backend
+from session.compaction import compact, summarize
+
+MAX_CACHED_HISTORIES = 1000
+
+
+def _render(m: Message) -> tuple[str, str, str | None]:
+    """(role, content, summary) with the agent prefix on assistant turns."""
+    prefix = f"[{m.agent}]: " if m.role == "assistant" else ""
+    return m.role, prefix + m.content, prefix + m.summary if m.summary else None
+
+
+def _as_message(turn: tuple) -> dict:
+    return {"role": turn[0], "content": turn[1]}
+
+
+def _merge(a: tuple, b: tuple) -> tuple:
+    """Consecutive messages with the same role (fan-out answers) form one turn."""
+    summary = (a[2] or a[1]) + "\n\n" + (b[2] or b[1]) if a[2] or b[2] else None
+    return a[0], a[1] + "\n\n" + b[1], summary
+
+
+class _History:
+    """Rendered history of one session at a backend version."""
+
+    __slots__ = ("version", "pieces", "turns", "sizes", "messages", "compacted", "last_agent")
+
+    def __init__(self, version: int, messages: list[Message], max_messages: int):
+        self.version = version
+        self.pieces: deque[tuple] = deque(maxlen=max_messages)  # one per stored message
+        self.turns: list[tuple] = []  # merged (role, content, summary)
+        self.sizes: list[int] = []  # stored messages per turn
+        self.messages: list[dict] = []
+        self.compacted: dict[int, list[dict]] = {}  # token budget -> messages
+        self.last_agent: str | None = None  # agent of the most recent answer
+        for m in messages:
+            self._add(_render(m))
+            if m.role == "assistant":
+                self.last_agent = m.agent
+        self.messages = [_as_message(t) for t in self.turns]
+
+    def append(self, version: int, m: Message):
+        front, merged = self._add(_render(m))
+        # Copy-on-write: lists already handed out never change
+        messages = self.messages[1:] if front == "dropped" else self.messages[:]
+        if front == "shrunk":
+            messages[0] = _as_message(self.turns[0])
+        if merged:
+            messages[-1] = _as_message(self.turns[-1])
+        else:
+            messages.append(_as_message(self.turns[-1]))
+        self.messages = messages
+        self.version = version
+        self.compacted = {}
+        if m.role == "assistant":
+            self.last_agent = m.agent
+
+    def _add(self, piece: tuple) -> tuple[str | None, bool]:
+        """Add one stored message. Returns (what happened to the first turn:
+        None | "shrunk" | "dropped", whether the piece merged into the last turn)."""
+        front = None
+        if len(self.pieces) == self.pieces.maxlen:
+            # The oldest stored message is trimmed with it
+            self.pieces.popleft()
+            self.sizes[0] -= 1
+            if self.sizes[0]:
+                self.turns[0] = reduce(_merge, list(self.pieces)[:self.sizes[0]])
+                front = "shrunk"
+            else:
+                del self.turns[0], self.sizes[0]
+                front = "dropped"
+        self.pieces.append(piece)
+        if self.turns and self.turns[-1][0] == piece[0]:
+            self.turns[-1] = _merge(self.turns[-1], piece)
+            self.sizes[-1] += 1
+            return front, True
+        self.turns.append(piece)
+        self.sizes.append(1)
+        return front, False
 
 
 class ContextStore:
-    def __init__(self):
-        self._sessions: dict[str, list[dict]] = defaultdict(list)
-
-    def add_message(self, session_id: str, role: str, agent: str, content: str):
-        self._sessions[session_id].append({
-            "role": role,
-            "agent": agent,
-            "content": content,
-            "timestamp": datetime.utcnow().isoformat(),
-        })
-        if len(self._sessions[session_id]) > MAX_MESSAGES:
-            self._sessions[session_id] = self._sessions[session_id][-MAX_MESSAGES:]
-
-    def get_claude_messages(self, session_id: str) -> list[dict]:
-        """Return conversation history in Claude API format with agent prefixes."""
-        out = []
-        for m in self._sessions[session_id]:
-            prefix = f"[{m['agent']}]: " if m["role"] == "assistant" else ""
-            out.append({"role": m["role"], "content": prefix + m["content"]})
-        return out
-
-    def clear(self, session_id: str):
-        self._sessions.pop(session_id, None)
+    def __init__(self, backend: SessionBackend):
+        self.backend = backend
+        self._histories: OrderedDict[str, _History] = OrderedDict()
+        # Sessions evicted by the backend (possibly from its maintenance thread),
+        # dropped from _histories on the event loop by _forget_evicted()
+        self._evicted: deque[str] = deque()
+        backend.on_evict = self._evicted.append
+
+    async def add_message(self, session_id: str, role: str, agent: str, content: str):
+        summary = summarize(content) if role == "assistant" else None
+        message = Message(role, agent, content, summary=summary)
+        previous, version = await self._call(self.backend.append, session_id, message)
+        self._forget_evicted()
+        history = self._histories.get(session_id)
+        if history is not None and history.version == previous:
+            history.append(version, message)
+        else:
+            self._histories.pop(session_id, None)  # changed elsewhere; rebuilt on next read
+
+    async def last_agent(self, session_id: str) -> str | None:
+        """Name of the agent that gave the most recent answer, if any."""
+        history = await self._history(session_id)
+        return history.last_agent if history is not None else None
+
+    async def get_claude_messages(self, session_id: str, token_budget: int | None = None) -> list[dict]:
+        """Return conversation history in Claude API format with agent prefixes.
+        Consecutive answers from several agents (fan-out) are merged into one
+        assistant turn so roles keep alternating. With token_budget, old long
+        answers are summarized and the oldest turns dropped to fit.
+        The list is shared; do not mutate it."""
+        history = await self._history(session_id)
+        if history is None:
+            return []
+        if token_budget is None:
+            return history.messages
+        compacted = history.compacted.get(token_budget)
+        if compacted is None:
+            trimmed = len(history.pieces) == history.pieces.maxlen
+            compacted = history.compacted[token_budget] = compact(history.turns, token_budget, trimmed)
+        return compacted
+
+    async def clear(self, session_id: str):
+        self._histories.pop(session_id, None)
+        await self._call(self.backend.clear, session_id)
+
+    async def stats(self) -> dict:
+        return await self._call(self.backend.stats)
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    def _forget_evicted(self):
+        while self._evicted:
+            self._histories.pop(self._evicted.popleft(), None)
+
+    async def _history(self, session_id: str) -> _History | None:
+        version = await self._call(self.backend.version, session_id)
+        self._forget_evicted()
+        if not version:
+            self._histories.pop(session_id, None)
+            return None
+        history = self._histories.get(session_id)
+        if history is None or history.version != version:
+            messages = await self._call(self.backend.load, session_id)
+            history = _History(version, messages, self.backend.max_messages)
+            self._histories[session_id] = history
+            while len(self._histories) > MAX_CACHED_HISTORIES:
+                self._histories.popitem(last=False)
+        self._histories.move_to_end(session_id)
+        return history
+
 
+_settings = get_settings()
 
 # Singleton
-context_store = ContextStore()
+context_store = ContextStore(create_backend(_settings.session_backend, _settings.session_db_path))
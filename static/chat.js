@@ -7,6 +7,7 @@ function getCookie(name) {
 let sessionId = getCookie("bio_session") || null;
 let isStreaming = false;
 let activeAgent = null;
+const RESUME_ATTEMPTS = 3;  // reconnects to /api/chat/resume after a dropped stream
 
 // ─── Pending image state ───────────────────────────────────
 let pendingImageId  = null;
@@ -226,83 +227,119 @@ async function sendMessage(text) {
   clearImagePreview();
   const typing = addTypingIndicator();
 
+  // `done` ends the answer; follow-up suggestions may still trail it on the stream
+  let finished = false;
+  const finish = () => {
+    if (finished) return;
+    finished = true;
+    typing.remove();
+    isStreaming = false;
+    sendBtn.disabled = false;
+    setActiveAgent(null);
+  };
+
   try {
-    const res = await fetch("/api/chat", {
+    let agentBody = null;
+    const agentBodies = {};  // agent_key -> body, for multi-agent (tagged) streams
+    const bodyFor = payload => (payload.agent_key && agentBodies[payload.agent_key]) || agentBody;
+    let lastEventId = null;
+
+    const readStream = async (res) => {
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split("\n");
+        buffer = lines.pop();
+
+        for (const line of lines) {
+          if (line.startsWith("id: ")) { lastEventId = line.slice(4); continue; }
+          if (!line.startsWith("data: ")) continue;
+          let payload;
+          try { payload = JSON.parse(line.slice(6)); } catch { continue; }
+
+          if (payload.type === "session_id") {
+            sessionId = payload.session_id;
+          } else if (payload.type === "agent") {
+            typing.remove();
+            activeAgent = payload.agent_key;
+            setActiveAgent(activeAgent);
+            agentBody = addAgentMessage(payload.agent, payload.agent_key);
+            agentBodies[payload.agent_key] = agentBody;
+          } else if (payload.type === "queued") {
+            const body = bodyFor(payload);
+            if (body && !body._raw) {
+              body.innerHTML = `<em class="queued">Waiting for capacity… position ${payload.position}</em>`;
+            }
+          } else if (payload.type === "text") {
+            const body = bodyFor(payload);
+            if (body) {
+              body._raw += payload.content;
+              body.innerHTML = renderMarkdown(body._raw);
+              scrollToBottom();
+            }
+          } else if (payload.type === "follow_up") {
+            const el = document.createElement("div");
+            el.className = "follow-up";
+            payload.questions.forEach(q => {
+              const btn = document.createElement("button");
+              btn.className = `suggested-btn suggested-btn--${payload.agent_key}`;
+              btn.textContent = q;
+              btn.onclick = () => {
+                input.value = `@${payload.agent_key} ${q}`;
+                el.remove();
+                input.focus();
+              };
+              el.appendChild(btn);
+            });
+            chat.appendChild(el);
+            scrollToBottom();
+          } else if (payload.type === "error") {
+            typing.remove();
+            const errEl = document.createElement("div");
+            errEl.className = "message message--agent";
+            errEl.textContent = (payload.agent_key ? `Error (${payload.agent_key}): ` : "Error: ") + payload.content;
+            chat.appendChild(errEl);
+          } else if (payload.type === "done") {
+            finish();
+          }
+        }
+      }
+    };
+
+    let res = await fetch("/api/chat", {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ message: text, session_id: sessionId, image_id: imageId }),
     });
-
-    if (!res.ok) throw new Error(`HTTP ${res.status}`);
-
-    const reader = res.body.getReader();
-    const decoder = new TextDecoder();
-    let agentBody = null;
-    let buffer = "";
-
+    let attempts = 0;
     while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-
-      buffer += decoder.decode(value, { stream: true });
-      const lines = buffer.split("\n");
-      buffer = lines.pop();
-
-      for (const line of lines) {
-        if (!line.startsWith("data: ")) continue;
-        let payload;
-        try { payload = JSON.parse(line.slice(6)); } catch { continue; }
-
-        if (payload.type === "session_id") {
-          sessionId = payload.session_id;
-        } else if (payload.type === "agent") {
-          typing.remove();
-          activeAgent = payload.agent_key;
-          setActiveAgent(activeAgent);
-          agentBody = addAgentMessage(payload.agent, payload.agent_key);
-        } else if (payload.type === "text") {
-          if (agentBody) {
-            agentBody._raw += payload.content;
-            agentBody.innerHTML = renderMarkdown(agentBody._raw);
-            scrollToBottom();
-          }
-        } else if (payload.type === "follow_up") {
-          const el = document.createElement("div");
-          el.className = "follow-up";
-          payload.questions.forEach(q => {
-            const btn = document.createElement("button");
-            btn.className = `suggested-btn suggested-btn--${payload.agent_key}`;
-            btn.textContent = q;
-            btn.onclick = () => {
-              input.value = `@${payload.agent_key} ${q}`;
-              el.remove();
-              input.focus();
-            };
-            el.appendChild(btn);
-          });
-          chat.appendChild(el);
-          scrollToBottom();
-        } else if (payload.type === "error") {
-          typing.remove();
-          const errEl = document.createElement("div");
-          errEl.className = "message message--agent";
-          errEl.textContent = "Error: " + payload.content;
-          chat.appendChild(errEl);
-        } else if (payload.type === "done") {
-          break;
-        }
+      try {
+        if (!res.ok) throw new Error(`HTTP ${res.status}`);
+        await readStream(res);
+        break;
+      } catch (err) {
+        // Dropped mid-answer: reconnect and replay from the last event seen
+        if (finished || !lastEventId || res.status === 410 || ++attempts > RESUME_ATTEMPTS) throw err;
+        await new Promise(resolve => setTimeout(resolve, 1000 * attempts));
+        res = await fetch("/api/chat/resume", { headers: { "Last-Event-ID": lastEventId } })
+          .catch(() => ({ ok: false, status: 0 }));
       }
     }
   } catch (err) {
+    if (finished) return;
     typing.remove();
     const errEl = document.createElement("div");
     errEl.className = "message message--agent";
     errEl.textContent = "Connection error: " + err.message;
     chat.appendChild(errEl);
   } finally {
-    isStreaming = false;
-    sendBtn.disabled = false;
-    setActiveAgent(null);
+    finish();
   }
 }
 
@@ -0,0 +1,103 @@
+"""
+Tool execution layer — keeps tool work off the asyncio event loop.
+
+Each tool declares a ToolSpec: "io" tools run on a shared thread pool, "cpu"
+tools on a shared process pool, and "async" tools (already non-blocking) on
+the loop itself. Every tool has its own concurrency cap and timeout so one
+slow or heavy tool cannot starve streaming for other users.
+
+Spawned pool workers take over a second to start and import their tool
+modules, so startup() does that at boot rather than on the first cpu call.
+"""
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+
+from config import get_settings
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    kind: str = "io"  # "io" → thread pool, "cpu" → process pool, "async" → event loop
+    max_concurrency: int = 4
+    timeout: float = 60.0  # seconds
+
+
+_thread_pool: ThreadPoolExecutor | None = None
+_process_pool: ProcessPoolExecutor | None = None
+_semaphores: dict[str, asyncio.Semaphore] = {}
+
+logger = logging.getLogger(__name__)
+
+
+def _process_workers() -> int:
+    return get_settings().tool_process_workers or min(4, os.cpu_count() or 1)
+
+
+def _pool(kind: str) -> Executor:
+    global _thread_pool, _process_pool
+    s = get_settings()
+    if kind == "cpu":
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=_process_workers(),
+                # spawn: never fork a process that holds the event loop and threads
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _process_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=s.tool_thread_workers, thread_name_prefix="tool"
+        )
+    return _thread_pool
+
+
+async def run(tool_name: str, spec: ToolSpec, fn, /, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) according to spec, holding the tool's concurrency slot.
+    Raises asyncio.TimeoutError if it takes longer than spec.timeout. Pool work
+    that has already started cannot be interrupted; only the wait is abandoned.
+    """
+    sem = _semaphores.get(tool_name)
+    if sem is None:
+        sem = _semaphores[tool_name] = asyncio.Semaphore(spec.max_concurrency)
+    async with sem:
+        if spec.kind == "async":
+            aw = fn(*args, **kwargs)
+        else:
+            loop = asyncio.get_running_loop()
+            aw = loop.run_in_executor(_pool(spec.kind), partial(fn, *args, **kwargs))
+        return await asyncio.wait_for(aw, spec.timeout)
+
+
+def _import(modules: tuple[str, ...]):
+    for name in modules:
+        importlib.import_module(name)
+
+
+async def startup(modules: tuple[str, ...] = ()):
+    """Start every process pool worker and import modules in it. Work sent
+    meanwhile simply queues behind it."""
+    loop = asyncio.get_running_loop()
+    pool = _pool("cpu")
+    try:
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, _import, modules) for _ in range(_process_workers())
+        ))
+    except Exception:
+        logger.exception("Could not pre-start the tool process pool")
+
+
+def shutdown():
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
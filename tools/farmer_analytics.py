@@ -258,7 +258,7 @@ def main(
         runs = _cast_runs(_load(runs_csv_url))
         trt  = _cast_trt(_load(treatments_csv_url))
     except Exception as e:
-        return {"result": f"Could not load CSV(s): {e}"}
+        return {"result": f"ERROR: Could not load CSV(s): {e}"}
 
     rows = runs if dataset == "runs" else trt
 
@@ -412,4 +412,4 @@ def main(
                               f"dataset=runs, year={year or 'any'}, recipe={recipe or 'any'}",
                               limit=top_k)}
 
-    return {"result": f"Unknown intent: {intent}"}
+    return {"result": f"ERROR: Unknown intent: {intent}"}
@@ -153,7 +153,7 @@ def main(
     field_name     = _norm_str(field_name)
 
     if action not in {"list_fields", "describe_field", "list_outputs", "dataset_diff", "coverage_stats"}:
-        return _out(f"Error: unknown action '{action}'.")
+        return _out(f"ERROR: unknown action '{action}'.")
     if dataset_scope not in {"2024", "2025", "both"}:
         dataset_scope = "both"
     if table not in {"runs", "treatments", "both"}:
@@ -163,7 +163,7 @@ def main(
         runs_all = _load(runs_csv_url)
         trt_all  = _load(treatments_csv_url)
     except Exception as e:
-        return _out(f"Could not load CSV(s): {e}")
+        return _out(f"ERROR: Could not load CSV(s): {e}")
 
     tables = ["runs", "treatments"] if table == "both" else [table]
     parts  = []
@@ -245,4 +245,4 @@ def main(
             parts.append(f"Coverage stats — {t} (scope={dataset_scope}): rows={nrows}, columns={len(header)}\n\n{md}")
         return _out("\n\n".join(parts))
 
-    return _out("Error: unhandled action.")
+    return _out("ERROR: unhandled action.")
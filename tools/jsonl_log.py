@@ -0,0 +1,68 @@
+"""
+Size-capped JSON-lines logs written off the request path.
+
+append() only enqueues; a daemon thread writes the queued lines in batches.
+Before a batch would take the file past max_bytes the file is rotated to
+"<name>.1" (one generation kept), so a log holds about 2 * max_bytes on disk.
+"""
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+
+import metrics
+
+
+class JsonlLog:
+    def __init__(self, path: Path, max_bytes: int):
+        self.path = path
+        self.rotated = path.with_name(path.name + ".1")
+        self.max_bytes = max_bytes
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def append(self, entry: dict):
+        """Queue one entry for writing. Never blocks or raises."""
+        self._queue.put(json.dumps(entry) + "\n")
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._run, name=f"jsonl-{self.path.stem}", daemon=True
+                    )
+                    self._writer.start()
+
+    def read_lines(self) -> list[str]:
+        """Lines of the rotated and the current file, oldest first."""
+        lines = []
+        for p in (self.rotated, self.path):
+            try:
+                lines.extend(p.read_text(encoding="utf-8").splitlines())
+            except OSError:
+                pass
+        return lines
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            while True:  # batch whatever else is queued
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write("".join(lines))
+            except OSError:
+                metrics.incr(f"log.{self.path.stem}.write_errors")
+
+    def _write(self, data: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.path.stat().st_size + len(data) > self.max_bytes:
+                os.replace(self.path, self.rotated)
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
@@ -1,62 +1,316 @@
 """
-Knowledge base loader with keyword search for Designer agent.
-Phase 1: paragraph chunking + keyword scoring.
-Phase 2: swap in vector search (Qdrant/Pinecone).
+Knowledge base loader with hybrid search for Designer agent.
+Phase 1: paragraph chunking + keyword scoring over an in-memory inverted index.
+Phase 2: hybrid keyword + local dense-vector scoring (tools/kb_vectors.py).
+
+The index is maintained per file: uploads and deletes in the settings API call
+update_file() / remove_file(), and sync() reconciles the index against disk
+(mtime/size first, content hash second) so unchanged files are never re-chunked.
+While serving, run() repeats sync() in a thread every SYNC_INTERVAL so request
+handlers read a current index without touching the disk on the event loop.
 """
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 
+import numpy as np
+
+from tools.kb_packing import Candidate, pack
+from tools.kb_vectors import VectorIndex
+
 KB_DIR = Path(__file__).parent.parent / "data" / "kb"
 CHUNK_SIZE = 600  # chars per chunk
+HYBRID_ALPHA = 0.5  # weight of vector cosine vs. keyword overlap in search()
+CANDIDATE_FACTOR = 3  # retrieve top_k * factor candidates for packing
+DEFAULT_TOKEN_BUDGET = 1200  # tokens for one search_knowledge_base result
+GRAM_MAX = 3  # token substrings up to this length are indexed for word lookup
+MATCH_CACHE_SIZE = 4096  # query words whose matching chunk ids are kept
+SYNC_INTERVAL = 2.0  # seconds; disk changes made outside this process show up within this
 
+logger = logging.getLogger(__name__)
 
-def _load_chunks(exclude: set[str] | None = None) -> list[tuple[str, str]]:
-    """Return list of (source_filename, chunk_text) from all KB .md files."""
-    exclude = exclude or set()
+
+def _chunk_text(text: str) -> list[str]:
+    """Split markdown text into paragraph chunks of at most CHUNK_SIZE chars."""
     chunks = []
-    for md_file in sorted(KB_DIR.glob("*.md")):
-        if md_file.name in exclude:
-            continue
-        text = md_file.read_text(encoding="utf-8", errors="ignore")
-        paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-        for para in paragraphs:
-            if len(para) > CHUNK_SIZE:
-                for i in range(0, len(para), CHUNK_SIZE):
-                    chunk = para[i : i + CHUNK_SIZE].strip()
-                    if chunk:
-                        chunks.append((md_file.name, chunk))
-            else:
-                chunks.append((md_file.name, para))
+    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
+    for para in paragraphs:
+        if len(para) > CHUNK_SIZE:
+            for i in range(0, len(para), CHUNK_SIZE):
+                chunk = para[i : i + CHUNK_SIZE].strip()
+                if chunk:
+                    chunks.append(chunk)
+        else:
+            chunks.append(para)
     return chunks
 
 
-def search(query: str, top_k: int = 4, exclude: set[str] | None = None) -> str:
+@dataclass
+class _FileEntry:
+    sha256: str
+    mtime_ns: int
+    size: int
+    chunk_ids: list[int] = field(default_factory=list)
+
+
+class KBIndex:
     """
-    Keyword search over KB markdown files.
-    Returns a formatted string of the top_k most relevant chunks.
+    Inverted index over KB chunks, keyed by whitespace-delimited lowercase tokens.
+    A query word matches a chunk when it is a substring of one of the chunk's
+    tokens, which is the same rule as `word in chunk.lower()`. Tokens are also
+    indexed by their substrings of up to GRAM_MAX chars, so the tokens
+    containing a word are found from its rarest gram instead of scanning the
+    vocabulary, and each word's matching chunk ids are cached until the index
+    changes.
     """
-    chunks = _load_chunks(exclude=exclude)
-    if not chunks:
+
+    def __init__(self, kb_dir: Path = KB_DIR):
+        self.kb_dir = kb_dir
+        self.version = 0  # bumped on every change; in-process cache key only
+        self._content_version: tuple[int, str] | None = None  # (version, digest)
+        self._files: dict[str, _FileEntry] = {}
+        self._chunks: dict[int, tuple[str, int, str]] = {}  # id -> (source, position, text)
+        self._postings: dict[str, set[int]] = {}
+        self._grams: dict[str, set[str]] = {}  # substring -> tokens containing it
+        self._matches: dict[str, np.ndarray] = {}  # query word -> sorted chunk ids
+        self._matches_version = 0
+        self._next_id = 0
+        self._synced = 0.0
+        self._lock = threading.RLock()
+
+    # ─── Maintenance ──────────────────────────────────────────
+
+    def refresh(self, max_age: float = SYNC_INTERVAL):
+        """sync() unless this process did so within max_age seconds. Changes made
+        through update_file()/remove_file() are visible immediately either way."""
+        if time.monotonic() - self._synced >= max_age:
+            self.sync()
+
+    async def run(self, interval: float = SYNC_INTERVAL):
+        """Background task: sync() in a thread every interval."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception:
+                logger.exception("KB index sync failed")
+
+    def sync(self) -> dict:
+        """Reconcile the index with the KB directory. Returns counts of changes."""
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        with self._lock:
+            self._synced = time.monotonic()
+            on_disk = {p.name for p in self.kb_dir.glob("*.md")}
+            for name in sorted(set(self._files) - on_disk):
+                self._drop(name)
+                stats["removed"] += 1
+            for name in sorted(on_disk):
+                existed = name in self._files
+                if self.update_file(name):
+                    stats["updated" if existed else "added"] += 1
+                else:
+                    stats["unchanged"] += 1
+        return stats
+
+    def update_file(self, filename: str) -> bool:
+        """
+        (Re)index one file if its content changed. Returns True if postings changed.
+        Removes the file from the index if it no longer exists on disk.
+        """
+        name = Path(filename).name
+        path = self.kb_dir / name
+        with self._lock:
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                return self.remove_file(name)
+
+            entry = self._files.get(name)
+            if entry and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                return False
+
+            raw = path.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry and entry.sha256 == digest:
+                entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+                return False
+
+            if entry:
+                self._drop(name)
+            text = raw.decode("utf-8", errors="ignore")
+            entry = _FileEntry(sha256=digest, mtime_ns=st.st_mtime_ns, size=st.st_size)
+            for pos, chunk in enumerate(_chunk_text(text)):
+                cid = self._next_id
+                self._next_id += 1
+                self._chunks[cid] = (name, pos, chunk)
+                for tok in set(chunk.lower().split()):
+                    ids = self._postings.get(tok)
+                    if ids is None:
+                        ids = self._postings[tok] = set()
+                        for gram in _grams(tok):
+                            self._grams.setdefault(gram, set()).add(tok)
+                    ids.add(cid)
+                entry.chunk_ids.append(cid)
+            self._files[name] = entry
+            self.version += 1
+            return True
+
+    def remove_file(self, filename: str) -> bool:
+        """Drop a file's postings. Returns True if it was indexed."""
+        with self._lock:
+            return self._drop(Path(filename).name)
+
+    def _drop(self, name: str) -> bool:
+        entry = self._files.pop(name, None)
+        if entry is None:
+            return False
+        for cid in entry.chunk_ids:
+            _, _, chunk = self._chunks.pop(cid)
+            for tok in set(chunk.lower().split()):
+                ids = self._postings.get(tok)
+                if ids is not None:
+                    ids.discard(cid)
+                    if not ids:
+                        del self._postings[tok]
+                        for gram in _grams(tok):
+                            toks = self._grams[gram]
+                            toks.discard(tok)
+                            if not toks:
+                                del self._grams[gram]
+        self.version += 1
+        return True
+
+    # ─── Queries ──────────────────────────────────────────────
+
+    def content_version(self) -> str:
+        """
+        Digest of the indexed files' names and contents. Unlike `version` it is
+        the same across processes and restarts for the same KB, so it can key
+        caches that are persisted or shared between workers.
+        """
+        with self._lock:
+            if self._content_version is None or self._content_version[0] != self.version:
+                h = hashlib.sha256()
+                for name in sorted(self._files):
+                    h.update(f"{name}\0{self._files[name].sha256}\n".encode())
+                self._content_version = (self.version, h.hexdigest()[:16])
+            return self._content_version[1]
+
+    def has_chunks(self, exclude: set[str] | None = None) -> bool:
+        exclude = exclude or set()
+        with self._lock:
+            return any(e.chunk_ids for name, e in self._files.items() if name not in exclude)
+
+    def entries(self, exclude: set[str] | None = None) -> list[tuple[int, str, str]]:
+        """Return (chunk_id, source_filename, chunk_text) in file/paragraph order."""
+        exclude = exclude or set()
+        with self._lock:
+            out = []
+            for name in sorted(self._files):
+                if name in exclude:
+                    continue
+                out.extend(
+                    (cid, name, self._chunks[cid][2]) for cid in self._files[name].chunk_ids
+                )
+            return out
+
+    def chunks(self, exclude: set[str] | None = None) -> list[tuple[str, str]]:
+        """Return (source_filename, chunk_text) in file/paragraph order."""
+        return [(src, text) for _, src, text in self.entries(exclude=exclude)]
+
+    def keyword_matches(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        """(chunk ids, number of distinct query words found in each chunk)."""
+        with self._lock:
+            arrays = [self._word_matches(w) for w in set(query.lower().split())]
+        arrays = [a for a in arrays if len(a)]
+        if not arrays:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(arrays), return_counts=True)
+
+    def keyword_scores(self, query: str, exclude: set[str] | None = None) -> dict[int, int]:
+        """Map chunk id -> number of distinct query words found in the chunk."""
+        exclude = exclude or set()
+        ids, counts = self.keyword_matches(query)
+        with self._lock:
+            return {
+                int(cid): int(n)
+                for cid, n in zip(ids, counts)
+                if cid in self._chunks and self._chunks[cid][0] not in exclude
+            }
+
+    def _word_matches(self, word: str) -> np.ndarray:
+        """Sorted ids of chunks with a token containing `word`. Call with the lock held."""
+        if self._matches_version != self.version or len(self._matches) >= MATCH_CACHE_SIZE:
+            self._matches, self._matches_version = {}, self.version
+        ids = self._matches.get(word)
+        if ids is None:
+            if len(word) <= GRAM_MAX:
+                tokens = self._grams.get(word, ())
+            else:
+                grams = [self._grams.get(word[i:i + GRAM_MAX]) for i in range(len(word) - GRAM_MAX + 1)]
+                if all(grams):
+                    tokens = [t for t in min(grams, key=len) if word in t]
+                else:
+                    tokens = ()
+            matched = set().union(*(self._postings[t] for t in tokens))
+            ids = np.fromiter(matched, dtype=np.int64, count=len(matched))
+            ids.sort()
+            self._matches[word] = ids
+        return ids
+
+    def get(self, chunk_id: int) -> tuple[str, int, str]:
+        with self._lock:
+            return self._chunks[chunk_id]
+
+
+# Singletons
+kb_index = KBIndex()
+vector_index = VectorIndex(kb_index)
+
+
+def _grams(token: str) -> set[str]:
+    return {
+        token[i:i + n]
+        for n in range(1, GRAM_MAX + 1)
+        for i in range(len(token) - n + 1)
+    }
+
+
+def search(
+    query: str,
+    top_k: int = 4,
+    exclude: set[str] | None = None,
+    token_budget: int = DEFAULT_TOKEN_BUDGET,
+) -> str:
+    """
+    Hybrid keyword + vector search over KB markdown files.
+    Returns up to top_k relevant chunks, deduplicated, diversified and merged
+    where adjacent, packed to fit within token_budget.
+    """
+    kb_index.refresh()
+    if not kb_index.has_chunks(exclude=exclude):
         return (
             "No knowledge base files found. "
             "Please upload .md files in Settings → AI Designer."
         )
 
-    query_words = set(query.lower().split())
-
-    def score(text: str) -> int:
-        t = text.lower()
-        return sum(1 for w in query_words if w in t)
-
-    scored = sorted(
-        [(score(text), src, text) for src, text in chunks],
-        reverse=True,
-        key=lambda x: x[0],
+    n_words = max(1, len(set(query.lower().split())))
+    ids, counts = kb_index.keyword_matches(query)
+    ranked = vector_index.hybrid_top_k(
+        query, (ids, counts / n_words), k=top_k * CANDIDATE_FACTOR, alpha=HYBRID_ALPHA, exclude=exclude
     )
-    top = scored[:top_k]
-
-    # If no keyword match, fall back to first top_k chunks
-    if not top or top[0][0] == 0:
-        top = [(0, src, text) for src, text in chunks[:top_k]]
+    candidates = [
+        Candidate(*kb_index.get(cid), score=s) for cid, s in ranked if s > 0
+    ]
 
-    parts = [f"[{src}]\n{text}" for _, src, text in top]
-    return "\n\n---\n\n".join(parts)
+    # If nothing matched, fall back to first top_k chunks
+    if not candidates:
+        candidates = [
+            Candidate(src, pos, text, 0.0)
+            for pos, (src, text) in enumerate(kb_index.chunks(exclude=exclude)[:top_k])
+        ]
+    return pack(candidates, token_budget=token_budget, max_chunks=top_k)
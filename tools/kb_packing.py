@@ -0,0 +1,94 @@
+"""
+Context packing for KB search results.
+Turns ranked retrieval candidates into the most informative tool result that
+fits a token budget: drop near-duplicates, pick a diverse subset with MMR,
+then merge chunks that sit next to each other in the same file.
+"""
+import re
+from dataclasses import dataclass
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose/markdown
+DEDUPE_THRESHOLD = 0.85  # shingle Jaccard above which two chunks are duplicates
+MMR_LAMBDA = 0.7  # relevance vs. diversity trade-off
+SEPARATOR = "\n\n---\n\n"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass
+class Candidate:
+    source: str
+    position: int
+    text: str
+    score: float
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _shingles(text: str, n: int = 3) -> set[tuple[str, ...]]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack(candidates: list[Candidate], token_budget: int, max_chunks: int) -> str:
+    """
+    Select and format candidates (best first) within token_budget.
+    Returns the formatted "[source]\\ntext" blocks joined by SEPARATOR.
+    """
+    if not candidates:
+        return ""
+    shingles = [_shingles(c.text) for c in candidates]
+
+    # 1. Near-duplicate removal — candidates arrive best first, keep the first seen
+    kept: list[int] = []
+    for i in range(len(candidates)):
+        if all(_jaccard(shingles[i], shingles[j]) < DEDUPE_THRESHOLD for j in kept):
+            kept.append(i)
+
+    # 2. MMR selection under the budget
+    top_score = max(candidates[i].score for i in kept) or 1.0
+    selected: list[int] = []
+    used = 0
+    pool = list(kept)
+    while pool and len(selected) < max_chunks:
+        def mmr(i: int) -> float:
+            redundancy = max((_jaccard(shingles[i], shingles[j]) for j in selected), default=0.0)
+            return MMR_LAMBDA * candidates[i].score / top_score - (1 - MMR_LAMBDA) * redundancy
+
+        best = max(pool, key=mmr)
+        pool.remove(best)
+        cost = estimate_tokens(candidates[best].text) + estimate_tokens(SEPARATOR)
+        if used + cost > token_budget:
+            if selected:
+                continue
+            # Always return something: truncate the single best chunk to fit
+            c = candidates[best]
+            limit = max(0, token_budget * CHARS_PER_TOKEN - len(c.source) - 4)
+            candidates[best] = Candidate(c.source, c.position, c.text[:limit], c.score)
+            cost = token_budget
+        selected.append(best)
+        used += cost
+
+    # 3. Merge adjacent chunks from the same file, ordered by best member
+    chosen = sorted((candidates[i] for i in selected), key=lambda c: (c.source, c.position))
+    groups: list[list[Candidate]] = []
+    for c in chosen:
+        last = groups[-1][-1] if groups else None
+        if last and last.source == c.source and c.position == last.position + 1:
+            groups[-1].append(c)
+        else:
+            groups.append([c])
+    groups.sort(key=lambda g: -max(c.score for c in g))
+
+    parts = [f"[{g[0].source}]\n" + "\n\n".join(c.text for c in g) for g in groups]
+    return SEPARATOR.join(parts)
@@ -1,14 +1,30 @@
 """
 Replicate client for BC pellicle image analysis.
 Ported from AI Designer.yml code node; adapted for local files instead of Dify file IDs.
+
+Successful predictions are cached on disk under data/predictions, keyed on
+(image content hash, model version), so analysing the same photo again with
+the same model returns immediately instead of polling Replicate.
 """
 import asyncio
 import base64
+import hashlib
+import json
+import logging
+import os
+import re
 from pathlib import Path
 
 import httpx
 
+import metrics
+
 REPLICATE_API = "https://api.replicate.com/v1/predictions"
+PREDICTION_CACHE_DIR = Path(__file__).parent.parent / "data" / "predictions"
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+logger = logging.getLogger(__name__)
 
 
 def _fmt(x, nd=2):
@@ -18,14 +34,63 @@ def _fmt(x, nd=2):
         return "n/a"
 
 
+def image_hash(image_path: Path) -> str:
+    """sha256 of the image. Uploads are stored under their hash, so the name is
+    used as is; older uuid-named uploads are hashed from their bytes."""
+    if _DIGEST_RE.match(image_path.stem):
+        return image_path.stem
+    return hashlib.sha256(image_path.read_bytes()).hexdigest()
+
+
+def _cache_path(digest: str, rep_version: str) -> Path:
+    return PREDICTION_CACHE_DIR / f"{digest}_{Path(rep_version).name}.json"
+
+
+def _cached(path: Path) -> str | None:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))["text"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _store(path: Path, text: str):
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps({"text": text}), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Could not persist prediction: %s", e)
+
+
+def hit_rate() -> float | None:
+    return metrics.ratio("replicate_cache.hits", "replicate_cache.misses")
+
+
 async def run_prediction(image_path: str | Path, rep_token: str, rep_version: str) -> str:
     """
-    Submit image to Replicate, poll for result, return formatted prediction text.
+    Return formatted prediction text for the image, from the on-disk cache
+    when this image was already analysed with rep_version.
     """
     image_path = Path(image_path)
     if not image_path.exists():
         return f"ERROR: Image file not found ({image_path.name})."
 
+    cache_path = _cache_path(image_hash(image_path), rep_version)
+    text = _cached(cache_path)
+    if text is not None:
+        metrics.incr("replicate_cache.hits")
+        return text
+    metrics.incr("replicate_cache.misses")
+
+    text = await _predict(image_path, rep_token, rep_version)
+    if not text.startswith("ERROR"):  # never cache failures
+        _store(cache_path, text)
+    return text
+
+
+async def _predict(image_path: Path, rep_token: str, rep_version: str) -> str:
+    """Submit image to Replicate, poll for result, return formatted prediction text."""
     img_bytes = image_path.read_bytes()
     mime_map = {
         ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
@@ -2,15 +2,17 @@
 Reads and writes data/settings.json.
 Reloaded on every access — no restart needed after a settings update.
 """
+import copy
 import json
 from pathlib import Path
 
 SETTINGS_PATH = Path(__file__).parent.parent / "data" / "settings.json"
 
 DEFAULTS = {
-    "designer": {"replicate_version": "", "kb_files": []},
-    "farmer":   {"runs_url": "", "treatments_url": ""},
-    "cfo":      {"tem_model_file": "tem_model.md"},
+    "designer": {"replicate_version": "", "kb_files": [], "kb_token_budget": 1200,
+                 "kb_inline_max_chars": 40000, "history_token_budget": 6000},
+    "farmer":   {"runs_url": "", "treatments_url": "", "history_token_budget": 6000},
+    "cfo":      {"tem_model_file": "tem_model.md", "history_token_budget": 6000},
 }
 
 
@@ -23,11 +25,11 @@ def load() -> dict:
             for agent, defaults in DEFAULTS.items():
                 data.setdefault(agent, {})
                 for k, v in defaults.items():
-                    data[agent].setdefault(k, v)
+                    data[agent].setdefault(k, copy.deepcopy(v))
             return data
         except Exception:
             pass
-    return json.loads(json.dumps(DEFAULTS))
+    return copy.deepcopy(DEFAULTS)
 
 
 def save(data: dict):